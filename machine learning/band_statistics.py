@@ -0,0 +1,132 @@
+import json
+
+import numpy as np
+import pandas as pd
+import torch
+
+
+SEASONS = {12: "DJF", 1: "DJF", 2: "DJF", 3: "MAM", 4: "MAM", 5: "MAM",
+           6: "JJA", 7: "JJA", 8: "JJA", 9: "SON", 10: "SON", 11: "SON"}
+
+
+def season_of(date) -> str:
+    """
+    Meteorological season ("DJF", "MAM", "JJA", "SON") of a date string or timestamp.
+    """
+    return SEASONS[pd.Timestamp(date).month]
+
+
+class BandStatistics:
+    """
+    Streaming per-band statistics (count, mean, variance, min, max) over a reference archive.
+
+    Samples are reduced one at a time (optionally spatially sub-sampled) and merged with
+    Chan's parallel variance formula, so the archive never has to fit in memory. Global
+    statistics are always kept; per-season statistics are kept when a season is given.
+    """
+
+    def __init__(self, band_names=None):
+        self.band_names = list(band_names) if band_names is not None else None
+        self.groups = {}  # "all" or season -> dict of [C] float64 arrays
+
+    def update(self, tensor: torch.Tensor, season: str = None, subsample: int = 1):
+        """
+        Adds one sample of the archive.
+
+        Args:
+            tensor    : [B, C, T, H, W] or [C, T, H, W] satellite tensor (raw values)
+            season    : optional season key, e.g. season_of(date)
+            subsample : spatial stride used for the reduction (1 = every pixel)
+        """
+        if tensor.dim() == 4:
+            tensor = tensor.unsqueeze(0)
+        x = tensor[..., ::subsample, ::subsample].transpose(0, 1).reshape(tensor.size(1), -1)
+        x = x.to(torch.float64)
+
+        batch = {
+            "count": np.full(x.size(0), x.size(1), dtype=np.float64),
+            "mean": x.mean(dim=1).numpy(),
+            "m2": (x.var(dim=1, correction=0) * x.size(1)).numpy(),
+            "min": x.amin(dim=1).numpy(),
+            "max": x.amax(dim=1).numpy(),
+        }
+        for key in ["all"] + ([season] if season is not None else []):
+            self.groups[key] = self._merge(self.groups.get(key), batch)
+
+    @staticmethod
+    def _merge(a, b):
+        if a is None:
+            return dict(b)
+        n = a["count"] + b["count"]
+        delta = b["mean"] - a["mean"]
+        return {
+            "count": n,
+            "mean": a["mean"] + delta * b["count"] / n,
+            "m2": a["m2"] + b["m2"] + delta ** 2 * a["count"] * b["count"] / n,
+            "min": np.minimum(a["min"], b["min"]),
+            "max": np.maximum(a["max"], b["max"]),
+        }
+
+    def get(self, season: str = None) -> dict:
+        """
+        Returns mean/std/min/max per band for a season (falls back to the global group).
+        """
+        group = self.groups.get(season) if season is not None else None
+        group = group or self.groups["all"]
+        return {
+            "mean": group["mean"],
+            "std": np.sqrt(group["m2"] / np.maximum(group["count"] - 1, 1)),
+            "min": group["min"],
+            "max": group["max"],
+        }
+
+    def scale_shift(self, norm_type: str = "zscore", season: str = None, eps: float = 1e-6):
+        """
+        Per-band (scale, shift) so that normalized = raw * scale + shift.
+        """
+        stats = self.get(season)
+        if norm_type == "zscore":
+            scale = 1.0 / (stats["std"] + eps)
+            shift = -stats["mean"] * scale
+        elif norm_type == "minmax":
+            scale = 1.0 / (stats["max"] - stats["min"] + eps)
+            shift = -stats["min"] * scale
+        else:
+            raise ValueError(f"Unknown norm_type: {norm_type}")
+        return scale, shift
+
+    def save(self, path):
+        payload = {
+            "band_names": self.band_names,
+            "groups": {k: {f: v.tolist() for f, v in g.items()} for k, g in self.groups.items()},
+        }
+        with open(path, "w") as f:
+            json.dump(payload, f, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            payload = json.load(f)
+        stats = cls(payload["band_names"])
+        stats.groups = {k: {f: np.asarray(v, dtype=np.float64) for f, v in g.items()}
+                        for k, g in payload["groups"].items()}
+        return stats
+
+
+def compute_band_statistics(archive, band_names=None, subsample=4):
+    """
+    Computes BandStatistics over a reference archive.
+
+    Args:
+        archive    : iterable of (tensor [B, C, T, H, W], date or None) samples, e.g. a
+                     generator calling get_sentinel_image_tensor region by region
+        band_names : optional band names stored alongside the statistics
+        subsample  : spatial stride used for the reductions
+
+    Returns:
+        BandStatistics with global and per-season groups
+    """
+    stats = BandStatistics(band_names)
+    for tensor, date in archive:
+        stats.update(tensor, season=season_of(date) if date is not None else None, subsample=subsample)
+    return stats
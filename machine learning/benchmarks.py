@@ -0,0 +1,191 @@
+import argparse
+import json
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import torch
+
+from cdse_standin import CDSEStandIn
+from hybrid_fusion_pipeline import HybridFusionModel
+from hystorical_satellite_fetcher import get_sentinel_image_tensor
+from optimized_export import PeakRSSSampler
+from preprocess_health_data import (
+    align_cohort_to_satellite_times, downsample_health_to_satellite_times, flatten_patient_frames,
+    preprocess_health_data, preprocess_health_data_batched
+)
+from preprocess_satellite_data import preprocess_satellite_data
+from scene_cache import SceneCache
+
+
+HELSINKI = [24.54, 60.13, 25.15, 60.35]
+DATE_WINDOW = ("2024-08-01", "2024-10-01")
+SATELLITE_TIMES = ["2024-08-03", "2024-08-12", "2024-08-18", "2024-08-24", "2024-09-02"]
+
+
+def time_case(fn, repeat=5, warmup=1):
+    """
+    Runs fn warmup + repeat times.
+
+    Returns:
+        dict with median/min latency (ms) and peak RSS growth (MB) over the timed runs
+    """
+    for _ in range(warmup):
+        fn()
+    timings = []
+    with PeakRSSSampler() as rss:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "median_ms": statistics.median(timings),
+        "min_ms": min(timings),
+        "peak_rss_growth_mb": rss.peak_growth / 1024 ** 2,
+    }
+
+
+def fetch_cases(standin):
+    """
+    get_sentinel_image_tensor against the local CDSE stand-in: concurrency, single
+    multi-temporal request and warm SceneCache at two raster sizes.
+    """
+    config = standin.config()
+    for max_dim in (64, 256):
+        common = dict(config=config, visualize=False, max_dim=max_dim, n_images=5)
+        for workers in (1, 4):
+            yield f"fetch/max_dim={max_dim}/workers={workers}", \
+                lambda c=common, w=workers: get_sentinel_image_tensor(HELSINKI, *DATE_WINDOW, max_workers=w, **c)
+        yield f"fetch/max_dim={max_dim}/single_request", \
+            lambda c=common: get_sentinel_image_tensor(HELSINKI, *DATE_WINDOW, single_request=True, **c)
+
+        cache = SceneCache(tempfile.mkdtemp(prefix="bench_scenes_"))
+        get_sentinel_image_tensor(HELSINKI, *DATE_WINDOW, cache=cache, **common)  # warm the cache
+        yield f"fetch/max_dim={max_dim}/cached", \
+            lambda c=common, cache=cache: get_sentinel_image_tensor(HELSINKI, *DATE_WINDOW, cache=cache, **c)
+
+
+def satellite_preprocess_cases():
+    from band_statistics import BandStatistics
+
+    for B, C, T, H, W in [(1, 3, 5, 128, 128), (1, 3, 5, 512, 512), (4, 3, 10, 256, 256)]:
+        size = f"B={B}/C={C}/T={T}/H={H}/W={W}"
+        x = torch.rand(B, C, T, H, W) * 10000
+        stats = BandStatistics()
+        stats.update(x, subsample=4)
+        yield f"preprocess_satellite/{size}/zscore", lambda x=x: preprocess_satellite_data(x, norm_type="zscore")
+        yield f"preprocess_satellite/{size}/zscore_inplace", \
+            lambda x=x: preprocess_satellite_data(x, norm_type="zscore", inplace=True)
+        yield f"preprocess_satellite/{size}/stats_inplace", \
+            lambda x=x, s=stats: preprocess_satellite_data(x, inplace=True, stats=s)
+
+
+def health_preprocess_cases():
+    # Scaling with B of the pandas vs batched path (equivalence: test_preprocess_health_data.py)
+    rng = np.random.default_rng(0)
+    for B, T, F in [(16, 168, 6), (64, 48, 6), (128, 168, 6), (512, 168, 6), (1024, 168, 6)]:
+        x = rng.normal(size=(B, T, F)).astype(np.float32)
+        x[rng.random(x.shape) < 0.1] = np.nan
+        x[rng.random(x.shape) < 0.01] *= 20
+        x = torch.from_numpy(x)
+        yield f"preprocess_health/B={B}/T={T}/F={F}/pandas", lambda x=x: preprocess_health_data(x)
+        yield f"preprocess_health/B={B}/T={T}/F={F}/batched", lambda x=x: preprocess_health_data_batched(x)
+
+
+def alignment_cases():
+    rng = np.random.default_rng(0)
+    index = pd.date_range("2024-08-01", "2024-09-05", freq="1h")
+    for B in (100, 1000):
+        frames = [pd.DataFrame(rng.normal(size=(len(index), 6)), index=index) for _ in range(B)]
+        flat = flatten_patient_frames(frames)
+        yield f"align/B={B}/per_patient", \
+            lambda f=frames: [downsample_health_to_satellite_times(df, SATELLITE_TIMES) for df in f]
+        yield f"align/B={B}/cohort", lambda flat=flat, B=B: align_cohort_to_satellite_times(
+            *flat, SATELLITE_TIMES, n_patients=B
+        )
+
+
+def model_cases():
+    model = HybridFusionModel(health_input_dim=6, sat_input_channels=3, embed_dim=16, num_classes=2).eval()
+    for B, T, H, W in [(1, 48, 64, 64), (8, 48, 128, 128), (32, 168, 64, 64)]:
+        health = torch.randn(B, T, 6)
+        sat = torch.randn(B, 3, 5, H, W)
+
+        def forward(health=health, sat=sat):
+            with torch.inference_mode():
+                model(health, sat)
+
+        yield f"model_forward/B={B}/T={T}/H={H}/W={W}", forward
+
+
+def run_benchmarks(only=None, repeat=5, warmup=1, latency_ms=50.0, process_latency_ms=200.0):
+    """
+    Runs every benchmark case (or the ones whose name starts with one of `only`).
+
+    Fetch cases run against a CDSEStandIn with the given latencies, so results are
+    reproducible offline.
+
+    Returns:
+        dict name -> timing dict (see time_case)
+    """
+    results = {}
+    with CDSEStandIn(latency_ms=latency_ms, process_latency_ms=process_latency_ms) as standin:
+        groups = [fetch_cases(standin), satellite_preprocess_cases(), health_preprocess_cases(),
+                  alignment_cases(), model_cases()]
+        for group in groups:
+            for name, fn in group:
+                if only and not any(name.startswith(prefix) for prefix in only):
+                    continue
+                results[name] = time_case(fn, repeat=repeat, warmup=warmup)
+                print(f"{name:60s} {results[name]['median_ms']:10.2f} ms  "
+                      f"+{results[name]['peak_rss_growth_mb']:.1f} MB peak RSS", flush=True)
+    return results
+
+
+def check_regressions(results, baseline, tolerance=1.25, min_ms=1.0):
+    """
+    Compares median latencies with a saved baseline.
+
+    A case regresses when its median exceeds tolerance x the baseline median (cases
+    faster than min_ms in the baseline are skipped as too noisy).
+
+    Returns:
+        list of (name, baseline_ms, current_ms) for the regressed cases
+    """
+    regressions = []
+    for name, current in results.items():
+        reference = baseline.get(name)
+        if reference is None or reference["median_ms"] < min_ms:
+            continue
+        if current["median_ms"] > tolerance * reference["median_ms"]:
+            regressions.append((name, reference["median_ms"], current["median_ms"]))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HealthRadar performance benchmarks")
+    parser.add_argument("--only", nargs="*", default=None, help="name prefixes, e.g. fetch model_forward")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="stand-in catalog/token latency")
+    parser.add_argument("--process-latency-ms", type=float, default=200.0, help="stand-in process API latency")
+    parser.add_argument("--out", default=None, help="write the results as JSON")
+    parser.add_argument("--baseline", default=None, help="fail when slower than this results JSON")
+    parser.add_argument("--tolerance", type=float, default=1.25)
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.only, args.repeat, args.warmup, args.latency_ms, args.process_latency_ms)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = check_regressions(results, baseline, args.tolerance)
+        for name, reference, current in regressions:
+            print(f"REGRESSION {name}: {reference:.2f} ms -> {current:.2f} ms")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,356 @@
+import contextlib
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from sentinelhub import DataCollection, SentinelHubSession
+from sentinelhub.decoding import decode_data
+from sentinelhub.exceptions import DownloadFailedException
+from sentinelhub.time_utils import parse_time_interval, serialize_time
+
+try:
+    import fcntl
+except ImportError:  # Windows: the token file is still shared, just without locking
+    fcntl = None
+
+
+CDSE_URL = "https://sh.dataspace.copernicus.eu"
+DEFAULT_TOKEN_PATH = os.path.join(os.path.expanduser("~"), ".cache", "healthradar", "cdse_token.json")
+
+# Collection key -> API id; registered once per service URL by collection()
+COLLECTIONS = {
+    "s1_grd": "sentinel-1-grd",
+    "s2_l2a": "sentinel-2-l2a",
+}
+
+S1_VV_DB_EVALSCRIPT = """
+//VERSION=3
+function setup() {
+  return {
+    input: ["VV"],
+    output: { bands: 1, sampleType: "FLOAT32" }
+  };
+}
+function evaluatePixel(sample) {
+  let db = 10 * Math.log10(sample.VV);
+  if (!isFinite(db)) return [0];
+  return [Math.max(-20, Math.min(5, db))];
+}
+"""
+
+S2_NDVI_EVALSCRIPT = """
+//VERSION=3
+function setup() {
+  return {
+    input: ["B04", "B08"],
+    output: { bands: 1 }
+  };
+}
+function evaluatePixel(sample) {
+  let ndvi = (sample.B08 - sample.B04) / (sample.B08 + sample.B04);
+  return [ndvi];
+}
+"""
+
+_collections_lock = threading.Lock()
+
+
+def collection(key, service_url=CDSE_URL) -> DataCollection:
+    """
+    CDSE data collection ("s1_grd" or "s2_l2a") served from service_url, defined once
+    per URL (as cdse_<key> on CDSE itself); later calls return the same enum.
+    """
+    name = f"cdse_{key}"
+    if service_url.rstrip("/") != CDSE_URL:
+        name += "_" + hashlib.sha1(service_url.encode("utf-8")).hexdigest()[:8]
+    with _collections_lock:
+        if name in DataCollection.__members__:
+            return DataCollection[name]
+        return DataCollection.define(name=name, api_id=COLLECTIONS[key], service_url=service_url)
+
+
+class CDSEClient:
+    """
+    Shared CDSE client: cached OAuth token and one pooled keep-alive HTTP session.
+
+    The token is kept in memory and in a JSON file (one entry per token URL + client id,
+    written atomically under an fcntl lock), so every process on the machine reuses it
+    until shortly before it expires instead of repeating the token exchange. Catalog and
+    process requests go through a single requests.Session, so TLS connections are reused
+    across requests and threads. 429 answers are retried with exponential backoff.
+    """
+
+    def __init__(
+        self,
+        config=None,
+        token_path=DEFAULT_TOKEN_PATH,
+        pool_size=16,
+        max_retries=5,
+        base_delay=1.0,
+        max_delay=60.0,
+        refresh_margin=60,
+        timeout=120
+    ):
+        if config is None:
+            from cdse_config import get_config
+            config = get_config()
+        self.config = config
+        self.token_path = token_path
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.refresh_margin = refresh_margin
+        self.timeout = timeout
+        self.token_fetches = 0
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._token = None
+        self._token_lock = threading.Lock()
+        self._cache_key = f"{config.sh_token_url}|{config.sh_client_id}"
+
+    # --- Token ---
+
+    def _valid(self, token):
+        return token is not None and token["expires_at"] - self.refresh_margin > time.time()
+
+    def _read_token_file(self):
+        try:
+            with open(self.token_path) as f:
+                return json.load(f).get(self._cache_key)
+        except (OSError, ValueError):
+            return None
+
+    def _write_token_file(self, token):
+        try:
+            with open(self.token_path) as f:
+                tokens = json.load(f)
+        except (OSError, ValueError):
+            tokens = {}
+        if token is None:
+            tokens.pop(self._cache_key, None)
+        else:
+            tokens[self._cache_key] = token
+        tmp_path = f"{self.token_path}.{os.getpid()}.tmp"
+        with open(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as f:
+            json.dump(tokens, f)
+        os.replace(tmp_path, self.token_path)
+
+    def _fetch_token(self):
+        response = self.session.post(
+            self.config.sh_token_url,
+            data={
+                "grant_type": "client_credentials",
+                "client_id": self.config.sh_client_id,
+                "client_secret": self.config.sh_client_secret,
+            },
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        token = response.json()
+        token["expires_at"] = time.time() + token.get("expires_in", 0)
+        self.token_fetches += 1
+        return token
+
+    def token(self) -> dict:
+        """
+        Returns a valid token dict ("access_token", "expires_at", ...), from memory, the
+        shared token file or a new token exchange, in that order.
+        """
+        if self._valid(self._token):
+            return self._token
+        with self._token_lock:
+            if self._valid(self._token):
+                return self._token
+            if not (self.config.sh_client_id and self.config.sh_client_secret):
+                raise ValueError("sh_client_id and sh_client_secret must be set in cdse_config.get_config()")
+
+            with self._file_lock():  # one process exchanges, the others wait and reuse
+                token = self._read_token_file()
+                if not self._valid(token):
+                    token = self._fetch_token()
+                    self._write_token_file(token)
+            self._token = token
+            return token
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        # Exclusive flock guarding every read-modify-write of the shared token file
+        os.makedirs(os.path.dirname(self.token_path) or ".", exist_ok=True)
+        with open(self.token_path + ".lock", "w") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def invalidate_token(self, token=None):
+        """
+        Drops a token the service rejected (default: the current one) from memory and
+        from the shared file. The file entry is only removed while it still holds that
+        token, so a fresh token another process wrote meanwhile is kept.
+        """
+        with self._token_lock:
+            rejected = token or self._token
+            self._token = None
+            if rejected is None or not os.path.exists(self.token_path):
+                return
+            with self._file_lock():
+                stored = self._read_token_file()
+                if stored is not None and stored.get("access_token") == rejected.get("access_token"):
+                    self._write_token_file(None)
+
+    def sh_session(self) -> SentinelHubSession:
+        """
+        sentinelhub session built from the cached token, for code using sentinelhub's own
+        download clients (e.g. SentinelHubDownloadClient(session=client.sh_session())).
+        """
+        return SentinelHubSession.from_token(self.token())
+
+    # --- Requests ---
+
+    def post(self, url, payload, headers=None):
+        """
+        POSTs a JSON payload with the bearer token through the pooled session.
+
+        429 answers are retried with exponential backoff and jitter (or the Retry-After
+        delay when given), a 401 refreshes the token once; any other error is raised as
+        DownloadFailedException like sentinelhub does.
+        """
+        refreshed = False
+        for attempt in range(self.max_retries + 1):
+            token = self.token()
+            request_headers = {**(headers or {}), "Authorization": f"Bearer {token['access_token']}"}
+            response = self.session.post(url, json=payload, headers=request_headers, timeout=self.timeout)
+
+            if response.status_code == 401 and not refreshed:
+                self.invalidate_token(token)
+                refreshed = True
+                continue
+            if response.status_code == 429 and attempt < self.max_retries:
+                retry_after = response.headers.get("Retry-After")
+                delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+                time.sleep(float(retry_after) if retry_after else delay * (0.5 + random.random() / 2))
+                continue
+            try:
+                response.raise_for_status()
+            except requests.HTTPError as e:
+                raise DownloadFailedException(f"{url} failed: {response.text[:500]}", request_exception=e) from e
+            return response
+        raise DownloadFailedException(f"{url} failed after {self.max_retries} retries")
+
+    def get_data(self, request):
+        """
+        Executes a SentinelHubRequest (its download_list payloads) through the pooled
+        session and decodes the responses like request.get_data().
+        """
+        return [
+            decode_data(self.post(d.url, d.post_values, d.headers).content, d.data_type)
+            for d in request.download_list
+        ]
+
+    def search(self, collection, bbox=None, time=None, filter=None, filter_lang="cql2-json",
+               distinct=None, fields=None, limit=100):
+        """
+        Catalog search with the SentinelHubCatalog.search arguments (so the client can be
+        passed wherever a catalog is expected, e.g. SceneIndex.sync); follows pagination
+        and returns the list of features (or of dates with distinct="date").
+        """
+        start, end = serialize_time(parse_time_interval(time), use_tz=True)
+        payload = {
+            "collections": [collection.catalog_id if isinstance(collection, DataCollection) else collection],
+            "datetime": f"{start}/{end}",
+            "limit": limit,
+        }
+        if bbox is not None:
+            payload["bbox"] = list(bbox)
+        if filter is not None:
+            payload["filter"] = filter
+            payload["filter-lang"] = filter_lang
+        if distinct is not None:
+            payload["distinct"] = distinct
+        if fields is not None:
+            payload["fields"] = fields
+
+        url = f"{self.config.sh_base_url.rstrip('/')}/api/v1/catalog/1.0.0/search"
+        features = []
+        while True:
+            results = self.post(url, payload).json()
+            features.extend(results["features"])
+            next_token = results.get("context", {}).get("next")
+            if next_token is None or not results["features"]:
+                return features
+            payload["next"] = next_token
+
+
+_default_client = None
+_default_lock = threading.Lock()
+
+
+def get_client() -> CDSEClient:
+    """
+    Process-wide CDSEClient built from cdse_config.get_config().
+    """
+    global _default_client
+    with _default_lock:
+        if _default_client is None:
+            _default_client = CDSEClient()
+        return _default_client
+
+
+def fetch_s1_vv(bbox_coords, time_interval, resolution=60, out_path="s1_vv_mosaic.npy", client=None, max_workers=4):
+    """
+    Sentinel-1 GRD VV backscatter in dB (clipped to [-20, 5], most recent acquisition)
+    over an AOI of any size.
+
+    Returns:
+        np.memmap [H, W] float32 mosaic backed by out_path
+    """
+    from tiled_fetcher import fetch_tiled_mosaic
+
+    client = client or get_client()
+    return fetch_tiled_mosaic(
+        bbox_coords=bbox_coords,
+        resolution=resolution,
+        evalscript=S1_VV_DB_EVALSCRIPT,
+        data_collection=collection("s1_grd", client.config.sh_base_url),
+        time_interval=time_interval,
+        out_path=out_path,
+        mosaicking_order="mostRecent",
+        max_workers=max_workers,
+        config=client.config,
+        client=client
+    )
+
+
+def fetch_s2_ndvi(bbox_coords, time_interval, resolution=60, out_path="s2_ndvi_mosaic.npy", client=None, max_workers=4):
+    """
+    Sentinel-2 L2A NDVI over an AOI of any size.
+
+    Returns:
+        np.memmap [H, W] float32 mosaic backed by out_path
+    """
+    from tiled_fetcher import fetch_tiled_mosaic
+
+    client = client or get_client()
+    return fetch_tiled_mosaic(
+        bbox_coords=bbox_coords,
+        resolution=resolution,
+        evalscript=S2_NDVI_EVALSCRIPT,
+        data_collection=collection("s2_l2a", client.config.sh_base_url),
+        time_interval=time_interval,
+        out_path=out_path,
+        max_workers=max_workers,
+        config=client.config,
+        client=client
+    )
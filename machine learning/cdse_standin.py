@@ -0,0 +1,325 @@
+import argparse
+import datetime as dt
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import tifffile
+from sentinelhub import SHConfig
+
+
+TOKEN_PATH = "/auth/realms/CDSE/protocol/openid-connect/token"
+CATALOG_PATH = "/api/v1/catalog/1.0.0/search"
+PROCESS_PATH = "/api/v1/process"
+
+_SAMPLE_TYPES = {"UINT8": np.uint8, "UINT16": np.uint16, "FLOAT32": np.float32}
+
+
+def _request_key(path, body):
+    # Canonical JSON, so the same request always maps to the same recording
+    try:
+        body = json.dumps(json.loads(body), sort_keys=True).encode("utf-8")
+    except ValueError:
+        pass
+    return hashlib.sha256(path.encode("utf-8") + b"\n" + body).hexdigest()
+
+
+def _max_cloud(query_filter):
+    """
+    Cloud-cover bound of a catalog filter (cql2-json or cql2-text), or None.
+    """
+    if isinstance(query_filter, str):
+        match = re.search(r"eo:cloud_cover\s*<=?\s*([\d.]+)", query_filter)
+        return float(match.group(1)) if match else None
+    if isinstance(query_filter, dict):
+        args = query_filter.get("args", [])
+        if query_filter.get("op") in ("<=", "<") and args and args[0] == {"property": "eo:cloud_cover"}:
+            return float(args[1])
+        for arg in args:
+            bound = _max_cloud(arg)
+            if bound is not None:
+                return bound
+    return None
+
+
+def synthesize_catalog(payload, revisit_days=2):
+    """
+    Deterministic catalog answer: one scene every revisit_days days with a pseudo-random
+    cloud cover, filtered and paginated like the Catalog API.
+    """
+    start, end = (dt.datetime.fromisoformat(t.replace("Z", "+00:00")).date() for t in payload["datetime"].split("/"))
+    collection = payload.get("collections", ["sentinel-2-l2a"])[0]
+    max_cloud = _max_cloud(payload.get("filter"))
+
+    features = []
+    day = start + dt.timedelta(days=(-start.toordinal()) % revisit_days)
+    while day <= end:
+        cloud = hashlib.sha256(f"{collection}{day}".encode()).digest()[0] / 255 * 100
+        if max_cloud is None or cloud <= max_cloud:
+            features.append({
+                "type": "Feature",
+                "id": f"{collection.upper()}_{day:%Y%m%d}T100000",
+                "bbox": payload.get("bbox"),
+                "properties": {
+                    "datetime": f"{day}T10:00:00Z",
+                    "eo:cloud_cover": round(cloud, 2),
+                    "platform": "sentinel-2a" if day.toordinal() % 2 else "sentinel-2b",
+                },
+            })
+        day += dt.timedelta(days=revisit_days)
+
+    if payload.get("distinct") == "date":
+        features = sorted({f["properties"]["datetime"][:10] for f in features})
+
+    offset, limit = int(payload.get("next") or 0), int(payload.get("limit") or 100)
+    page = features[offset:offset + limit]
+    context = {"limit": limit, "returned": len(page)}
+    if offset + limit < len(features):
+        context["next"] = offset + limit
+    return {"type": "FeatureCollection", "features": page, "context": context}
+
+
+def synthesize_process(payload):
+    """
+    Deterministic process API answer: a TIFF of the requested size, band count and sample
+    type (read from the evalscript), filled with noise seeded by the request.
+    """
+    output = payload.get("output", {})
+    width, height = int(output.get("width", 256)), int(output.get("height", 256))
+    evalscript = payload.get("evalscript", "")
+    n_bands = int(re.search(r"bands:\s*(\d+)", evalscript.split("output")[-1]).group(1)) if "output" in evalscript else 1
+    sample_type = re.search(r'sampleType:\s*"(\w+)"', evalscript)
+    dtype = _SAMPLE_TYPES.get(sample_type.group(1) if sample_type else "FLOAT32", np.float32)
+
+    seed = int(_request_key(PROCESS_PATH, json.dumps(payload).encode("utf-8"))[:8], 16)
+    rng = np.random.default_rng(seed)
+    if np.issubdtype(dtype, np.integer):
+        image = rng.integers(0, min(np.iinfo(dtype).max, 10000), (height, width, n_bands), dtype=dtype)
+    else:
+        image = rng.random((height, width, n_bands), dtype=np.float32)
+
+    buffer = io.BytesIO()
+    tifffile.imwrite(buffer, image)
+    return buffer.getvalue()
+
+
+class CDSEStandIn:
+    """
+    Local stand-in for the CDSE token, Catalog and Process APIs.
+
+    Requests are answered from recordings in record_dir (keyed by path and canonical
+    request body). Unrecorded requests are forwarded to the real service when an upstream
+    SHConfig with credentials is given (and recorded), or synthesized deterministically
+    otherwise. latency_ms / process_latency_ms (+ uniform jitter_ms) are added to every
+    answer and rate_limit_every=N answers every N-th process request with HTTP 429, so
+    concurrency, caching and backoff can be measured offline and reproducibly.
+    """
+
+    def __init__(
+        self,
+        record_dir=None,
+        latency_ms=0.0,
+        process_latency_ms=None,
+        jitter_ms=0.0,
+        rate_limit_every=0,
+        upstream=None,
+        host="127.0.0.1",
+        port=0,
+        seed=0
+    ):
+        self.record_dir = record_dir
+        self.latency = latency_ms / 1000
+        self.process_latency = (process_latency_ms if process_latency_ms is not None else latency_ms) / 1000
+        self.jitter = jitter_ms / 1000
+        self.rate_limit_every = rate_limit_every
+        self.upstream = upstream
+        self.counts = {"token": 0, "catalog": 0, "process": 0, "rate_limited": 0,
+                       "replayed": 0, "recorded": 0, "synthesized": 0}
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+        self._upstream_session = None
+        if record_dir is not None:
+            os.makedirs(record_dir, exist_ok=True)
+
+        self.server = ThreadingHTTPServer((host, port), self._make_handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def config(self) -> SHConfig:
+        """
+        SHConfig pointing every CDSE endpoint at the stand-in (dummy credentials). Only
+        usable while the stand-in runs, as plain http token requests are allowed only then.
+        """
+        config = SHConfig()
+        config.sh_client_id = "standin"
+        config.sh_client_secret = "standin"
+        config.sh_auth_base_url = f"{self.url}/auth/realms/CDSE"
+        config.sh_token_url = f"{self.url}{TOKEN_PATH}"
+        config.sh_base_url = self.url
+        return config
+
+    def start(self):
+        # The stand-in serves plain http on localhost; oauthlib allows that only while the
+        # stand-in runs, the previous value is restored by stop()
+        self._insecure_transport = os.environ.get("OAUTHLIB_INSECURE_TRANSPORT")
+        os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = "1"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self._insecure_transport is None:
+            os.environ.pop("OAUTHLIB_INSECURE_TRANSPORT", None)
+        else:
+            os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = self._insecure_transport
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _sleep(self, base):
+        with self._lock:
+            jitter = self._rng.uniform(0, self.jitter) if self.jitter else 0.0
+        if base + jitter > 0:
+            time.sleep(base + jitter)
+
+    def _count(self, key):
+        with self._lock:
+            self.counts[key] += 1
+            return self.counts[key]
+
+    def _forward(self, path, body):
+        from sentinelhub import SentinelHubSession
+        import requests
+
+        with self._lock:
+            if self._upstream_session is None:
+                self._upstream_session = SentinelHubSession(self.upstream)
+        headers = {**self._upstream_session.session_headers, "Content-Type": "application/json"}
+        response = requests.post(f"{self.upstream.sh_base_url.rstrip('/')}{path}", data=body, headers=headers)
+        response.raise_for_status()
+        return response.content, response.headers.get("Content-Type", "application/octet-stream")
+
+    def _answer(self, path, body):
+        """
+        Returns (status, content type, body bytes) for a catalog or process request.
+        """
+        key = _request_key(path, body)
+        if self.record_dir is not None:
+            recording = os.path.join(self.record_dir, key)
+            if os.path.exists(recording + ".json"):
+                with open(recording + ".json") as f:
+                    meta = json.load(f)
+                with open(recording + ".bin", "rb") as f:
+                    self._count("replayed")
+                    return 200, meta["content_type"], f.read()
+
+        if self.upstream is not None:
+            content, content_type = self._forward(path, body)
+            self._count("recorded")
+            if self.record_dir is not None:
+                with open(recording + ".bin", "wb") as f:
+                    f.write(content)
+                with open(recording + ".json", "w") as f:
+                    json.dump({"path": path, "content_type": content_type, "request": json.loads(body)}, f)
+            return 200, content_type, content
+
+        self._count("synthesized")
+        payload = json.loads(body)
+        if path == CATALOG_PATH:
+            return 200, "application/json", json.dumps(synthesize_catalog(payload)).encode("utf-8")
+        return 200, "image/tiff", synthesize_process(payload)
+
+    def _make_handler(self):
+        standin = self
+
+        class StandInHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True  # headers and body are separate writes on a kept-alive socket
+
+            def _send(self, status, content_type, body):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                path = self.path.split("?")[0]
+
+                if path == TOKEN_PATH:
+                    standin._count("token")
+                    token = {"access_token": "standin-token", "token_type": "Bearer", "expires_in": 3600}
+                    self._send(200, "application/json", json.dumps(token).encode("utf-8"))
+                    return
+                if path == CATALOG_PATH:
+                    standin._count("catalog")
+                    standin._sleep(standin.latency)
+                elif path == PROCESS_PATH:
+                    n = standin._count("process")
+                    standin._sleep(standin.process_latency)
+                    if standin.rate_limit_every and n % standin.rate_limit_every == 0:
+                        standin._count("rate_limited")
+                        self._send(429, "application/json", b'{"error": {"status": 429, "reason": "Too Many Requests"}}')
+                        return
+                else:
+                    self._send(404, "application/json", b'{"error": "not found"}')
+                    return
+
+                try:
+                    status, content_type, payload = standin._answer(path, body)
+                except Exception as e:
+                    status, content_type, payload = 500, "application/json", json.dumps({"error": str(e)}).encode("utf-8")
+                self._send(status, content_type, payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return StandInHandler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local record/replay stand-in for the CDSE APIs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--record-dir", default="cdse_recordings")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--process-latency-ms", type=float, default=None)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--rate-limit-every", type=int, default=0)
+    parser.add_argument("--record", action="store_true", help="forward unrecorded requests to CDSE (cdse_config credentials)")
+    args = parser.parse_args()
+
+    upstream = None
+    if args.record:
+        from cdse_config import get_config
+        upstream = get_config()
+
+    standin = CDSEStandIn(
+        record_dir=args.record_dir, latency_ms=args.latency_ms, process_latency_ms=args.process_latency_ms,
+        jitter_ms=args.jitter_ms, rate_limit_every=args.rate_limit_every, upstream=upstream,
+        host=args.host, port=args.port
+    )
+    print(f"CDSE stand-in listening on {standin.url} (record dir: {args.record_dir})")
+    try:
+        standin.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        standin.server.server_close()
@@ -0,0 +1,213 @@
+"""
+Headless HealthRadar batch CLI.
+
+    python cli.py fetch --bbox 24.54 60.13 25.15 60.35 --start 2024-08-01 --end 2024-10-01 --out sat.npy
+    python cli.py fetch --bbox 24.54 60.13 25.15 60.35 --start 2024-08-01 --end 2024-10-01 --layers NDVI NDWI VV_DB --out layers.npy
+    python cli.py preprocess --satellite sat.npy --satellite-out sat_clean.npy --health health.npy --health-out health_clean.npy
+    python cli.py score --satellite sat_clean.npy --health health_clean.npy --weights model.pt --out scores.csv
+
+Only the standard library is imported at startup; numpy, torch, pandas, sentinelhub and
+matplotlib are loaded by the subcommand that needs them, and nothing opens a window.
+"""
+import argparse
+import os
+import sys
+import time
+
+
+def _load_array(path):
+    import numpy as np
+
+    # Copy-on-write memmap: no read up front, in-place preprocessing never touches the file
+    return np.load(path, mmap_mode="c")
+
+
+def cmd_fetch(args):
+    import numpy as np
+    from hystorical_satellite_fetcher import get_sentinel_image_tensor
+
+    cache = scene_index = thumbnails = None
+    if args.cache_dir:
+        from scene_cache import SceneCache
+        cache = SceneCache(args.cache_dir)
+    if args.scene_index:
+        from scene_index import SceneIndex
+        scene_index = SceneIndex(args.scene_index)
+    if args.thumbnails:
+        from visualization import ThumbnailWriter
+        thumbnails = ThumbnailWriter(args.thumbnails)
+
+    try:
+        if args.layers:
+            from derived_indices import compute_layers
+
+            tensor = compute_layers(
+                args.bbox, args.start, args.end,
+                layers=args.layers,
+                n_images=args.n_images,
+                max_cloud=args.max_cloud,
+                max_dim=args.max_dim,
+                cache=cache,
+                max_workers=args.workers,
+                dtype=np.dtype(args.dtype),
+                out_path=args.out
+            )
+        else:
+            tensor = get_sentinel_image_tensor(
+                args.bbox, args.start, args.end,
+                n_images=args.n_images,
+                max_cloud=args.max_cloud,
+                bands=tuple(args.bands),
+                max_dim=args.max_dim,
+                cache=cache,
+                max_workers=args.workers,
+                single_request=args.single_request,
+                dtype=np.dtype(args.dtype),
+                out_path=args.out,
+                scene_index=scene_index,
+                thumbnails=thumbnails
+            )
+    finally:
+        if thumbnails is not None:
+            thumbnails.close()
+    print(f"Wrote {args.out} {list(tensor.shape[1:])} [C, T, H, W]")
+
+
+def cmd_preprocess(args):
+    import numpy as np
+    import torch
+
+    if args.satellite:
+        from preprocess_satellite_data import preprocess_satellite_data
+
+        stats = None
+        if args.stats:
+            from band_statistics import BandStatistics
+            stats = BandStatistics.load(args.stats)
+        sat = torch.from_numpy(_load_array(args.satellite)).unsqueeze(0)  # [1, C, T, H, W]
+        clean = preprocess_satellite_data(
+            sat, selected_channels=args.channels, norm_type=args.norm, inplace=True, stats=stats, season=args.season
+        )
+        np.save(args.satellite_out, clean[0].numpy())
+        print(f"Wrote {args.satellite_out} {list(clean.shape[1:])} [C, T, H, W]")
+
+    if args.health:
+        from preprocess_health_data import preprocess_health_data_batched
+
+        health = torch.from_numpy(np.asarray(_load_array(args.health), dtype=np.float32))
+        if health.dim() == 2:
+            health = health.unsqueeze(0)
+        clean = preprocess_health_data_batched(health, outlier_z=args.outlier_z)
+        np.save(args.health_out, clean.numpy())
+        print(f"Wrote {args.health_out} {list(clean.shape)} [B, T, F]")
+
+
+def cmd_score(args):
+    import numpy as np
+    import torch
+    from hybrid_fusion_pipeline import HybridFusionModel
+
+    sat = torch.from_numpy(np.asarray(_load_array(args.satellite), dtype=np.float32))
+    if sat.dim() == 4:
+        sat = sat.unsqueeze(0)  # [1, C, T, H, W]
+    health = torch.from_numpy(np.asarray(_load_array(args.health), dtype=np.float32))
+    if health.dim() == 2:
+        health = health.unsqueeze(0)  # [B, T, F]
+
+    model = HybridFusionModel(
+        health_input_dim=health.size(-1), sat_input_channels=sat.size(1),
+        embed_dim=args.embed_dim, num_classes=args.num_classes
+    )
+    if args.weights:
+        model.load_state_dict(torch.load(args.weights, map_location="cpu"))
+    else:
+        print("No --weights given, scoring with an untrained model", file=sys.stderr)
+    model.eval()
+
+    with torch.inference_mode():
+        # The region's satellite embedding is computed once and shared by every batch
+        if args.tile_size:
+            s_embed = model.sat_encoder.forward_tiled(sat, args.tile_size)
+        else:
+            s_embed = model.sat_encoder(sat)
+        probs = torch.cat([
+            torch.softmax(model.forward_with_sat_embedding(chunk, s_embed), dim=1)
+            for chunk in torch.split(health, args.batch_size)
+        ]).numpy()
+
+    if args.out.endswith(".npy"):
+        np.save(args.out, probs)
+    else:
+        header = "patient," + ",".join(f"p_class_{k}" for k in range(probs.shape[1]))
+        rows = np.column_stack([np.arange(len(probs)), probs])
+        np.savetxt(args.out, rows, delimiter=",", header=header, comments="", fmt=["%d"] + ["%.6f"] * probs.shape[1])
+    print(f"Scored {len(probs)} patients -> {args.out}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Headless HealthRadar batch jobs")
+    parser.add_argument("--trace", default=None, help="write stage timings as JSON lines (and .prom)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    fetch = sub.add_parser("fetch", help="download a Sentinel-2 [C, T, H, W] stack to .npy")
+    fetch.add_argument("--bbox", type=float, nargs=4, required=True, metavar=("MIN_LON", "MIN_LAT", "MAX_LON", "MAX_LAT"))
+    fetch.add_argument("--start", required=True)
+    fetch.add_argument("--end", required=True)
+    fetch.add_argument("--out", required=True)
+    fetch.add_argument("--n-images", type=int, default=5)
+    fetch.add_argument("--max-cloud", type=int, default=20)
+    fetch.add_argument("--bands", nargs="+", default=["B03", "B11", "B12"])
+    fetch.add_argument("--layers", nargs="+", default=None,
+                       help="derived indices / raw bands (e.g. NDVI NDWI VV_DB B11) computed locally from one raw fetch")
+    fetch.add_argument("--max-dim", type=int, default=512)
+    fetch.add_argument("--workers", type=int, default=4)
+    fetch.add_argument("--single-request", action="store_true")
+    fetch.add_argument("--dtype", default="float32")
+    fetch.add_argument("--cache-dir", default=None, help="SceneCache directory")
+    fetch.add_argument("--scene-index", default=None, help="SceneIndex SQLite path")
+    fetch.add_argument("--thumbnails", default=None, help="directory for PNG thumbnails (off by default)")
+    fetch.set_defaults(func=cmd_fetch)
+
+    preprocess = sub.add_parser("preprocess", help="normalize satellite and/or health arrays")
+    preprocess.add_argument("--satellite", default=None, help="[C, T, H, W] .npy")
+    preprocess.add_argument("--satellite-out", default="sat_clean.npy")
+    preprocess.add_argument("--channels", type=int, nargs="+", default=None)
+    preprocess.add_argument("--norm", choices=["zscore", "minmax"], default="zscore")
+    preprocess.add_argument("--stats", default=None, help="BandStatistics JSON")
+    preprocess.add_argument("--season", default=None)
+    preprocess.add_argument("--health", default=None, help="[B, T, F] .npy")
+    preprocess.add_argument("--health-out", default="health_clean.npy")
+    preprocess.add_argument("--outlier-z", type=float, default=3.0)
+    preprocess.set_defaults(func=cmd_preprocess)
+
+    score = sub.add_parser("score", help="score a cohort against a region's satellite stack")
+    score.add_argument("--satellite", required=True, help="preprocessed [C, T, H, W] .npy")
+    score.add_argument("--health", required=True, help="preprocessed [B, T, F] .npy")
+    score.add_argument("--weights", default=None, help="HybridFusionModel state_dict")
+    score.add_argument("--embed-dim", type=int, default=16)
+    score.add_argument("--num-classes", type=int, default=2)
+    score.add_argument("--batch-size", type=int, default=4096)
+    score.add_argument("--tile-size", type=int, default=None)
+    score.add_argument("--out", default="scores.csv", help=".csv or .npy")
+    score.set_defaults(func=cmd_score)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.trace:
+        import instrumentation
+        instrumentation.enable()
+
+    start = time.perf_counter()
+    args.func(args)
+    print(f"{args.command} finished in {time.perf_counter() - start:.2f} s", file=sys.stderr)
+
+    if args.trace:
+        instrumentation.write_jsonl(args.trace)
+        with open(os.path.splitext(args.trace)[0] + ".prom", "w") as f:
+            f.write(instrumentation.to_prometheus())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+import datetime as dt
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+from sentinelhub import BBox, CRS, MimeType, SentinelHubCatalog, SentinelHubRequest, bbox_to_dimensions
+
+from cdse_client import collection
+from hystorical_satellite_fetcher import build_evalscript, get_data_with_backoff
+from instrumentation import current_span, span, traced
+from scene_cache import make_scene_key
+
+
+# Raw band -> collection key (see cdse_client.COLLECTIONS); a raw band is also a valid layer
+BAND_COLLECTIONS = {
+    **{b: "s2_l2a" for b in ["B01", "B02", "B03", "B04", "B05", "B06", "B07", "B08", "B8A", "B09", "B11", "B12"]},
+    "VV": "s1_grd",
+    "VH": "s1_grd",
+}
+
+# Sample type requested per collection: S2 as lossless UINT16 digital numbers (ratios
+# are scale invariant), S1 as FLOAT32 linear backscatter (needed for dB)
+SAMPLE_TYPES = {"s2_l2a": "UINT16", "s1_grd": "FLOAT32"}
+
+INDICES = {}
+
+
+def register_index(name, bands, kernel):
+    """
+    Registers a derived index.
+
+    Args:
+        name   : str, layer name used in compute_layers(layers=...)
+        bands  : tuple of raw band names (all from the same collection)
+        kernel : callable(bands: dict name -> [H, W] float32 array, out: [H, W] array)
+                 writing the index into out; must leave NaN where it is undefined
+    """
+    collections = {BAND_COLLECTIONS[b] for b in bands}
+    if len(collections) != 1:
+        raise ValueError(f"Index {name} mixes collections {collections}")
+    INDICES[name] = {"bands": tuple(bands), "collection": collections.pop(), "kernel": kernel}
+
+
+def normalized_difference(a, b, out):
+    """
+    (a - b) / (a + b) into out with a single temporary; NaN where a + b == 0 or an input
+    is NaN.
+    """
+    denom = np.add(a, b, dtype=np.float32)
+    np.subtract(a, b, out=out, dtype=out.dtype, casting="unsafe")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        np.divide(out, denom, out=out, where=denom != 0)
+    out[denom == 0] = np.nan
+    return out
+
+
+def _ndvi(bands, out):
+    return normalized_difference(bands["B08"], bands["B04"], out)
+
+
+def _ndwi(bands, out):
+    return normalized_difference(bands["B03"], bands["B08"], out)
+
+
+def _vv_db(bands, out):
+    # 10 * log10(VV) clipped to [-20, 5] dB; non-positive backscatter (no data) -> NaN
+    vv = bands["VV"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        np.log10(vv, out=out, where=vv > 0, dtype=out.dtype, casting="unsafe")
+    out *= 10
+    np.clip(out, -20, 5, out=out)
+    out[~(vv > 0)] = np.nan
+    return out
+
+
+register_index("NDVI", ("B04", "B08"), _ndvi)
+register_index("NDWI", ("B03", "B08"), _ndwi)
+register_index("VV_DB", ("VV",), _vv_db)
+
+
+def _layer_spec(layer):
+    if layer in INDICES:
+        return INDICES[layer]
+    if layer in BAND_COLLECTIONS:
+        return {"bands": (layer,), "collection": BAND_COLLECTIONS[layer],
+                "kernel": lambda bands, out, b=layer: np.copyto(out, bands[b], casting="unsafe")}
+    raise KeyError(f"Unknown layer {layer!r}; registered indices: {sorted(INDICES)}")
+
+
+def plan_requests(layers):
+    """
+    Union of raw bands needed per collection for a set of layers (one request per
+    collection per scene).
+
+    Returns:
+        dict collection key -> tuple of bands (sorted)
+    """
+    plan = {}
+    for layer in layers:
+        spec = _layer_spec(layer)
+        plan.setdefault(spec["collection"], set()).update(spec["bands"])
+    return {key: tuple(sorted(bands)) for key, bands in plan.items()}
+
+
+def compute_indices(raw, layers, out):
+    """
+    Computes layers from already downloaded raw bands.
+
+    Args:
+        raw    : dict collection key -> (band names, [H, W, n_bands] array)
+        layers : list of layer names
+        out    : [len(layers), H, W] array written in place (e.g. buffer[:, t])
+    """
+    for c, layer in enumerate(layers):
+        spec = _layer_spec(layer)
+        names, image = raw[spec["collection"]]
+        bands = {b: image[..., names.index(b)] for b in spec["bands"]}
+        spec["kernel"](bands, out[c])
+    return out
+
+
+def _select_dates(catalog, data_collection, bbox, time_start, time_end, max_cloud, n_images):
+    query = {}
+    if data_collection.has_cloud_coverage:
+        query = {"filter": {"op": "<=", "args": [{"property": "eo:cloud_cover"}, max_cloud]},
+                 "filter_lang": "cql2-json"}
+    dates = list(catalog.search(collection=data_collection, bbox=bbox, time=(time_start, time_end),
+                                distinct="date", **query))
+    return dates[:n_images]
+
+
+@traced()
+def compute_layers(
+    bbox_coords,
+    time_start,
+    time_end,
+    layers=("NDVI", "NDWI", "VV_DB"),
+    n_images=5,
+    max_cloud=20,
+    max_dim=512,
+    s1_window_days=6,
+    config=None,
+    client=None,
+    cache=None,
+    max_workers=4,
+    max_retries=5,
+    dtype=np.float32,
+    out_path=None
+):
+    """
+    Fetches the union of raw bands once per scene and computes derived indices locally.
+
+    Time steps are the cloud-free Sentinel-2 dates (or the Sentinel-1 dates when only S1
+    layers are requested). Sentinel-1 is a different collection with its own acquisition
+    dates, so for each step the most recent S1 acquisition of the s1_window_days before
+    it is used: every scene costs one request per collection instead of one per layer.
+
+    Args:
+        bbox_coords    : list [min_lon, min_lat, max_lon, max_lat]
+        time_start/end : str, date range
+        layers         : registered index names (INDICES) or raw band names, in the
+                         channel order of the output
+        n_images       : int, number of time steps
+        max_cloud      : int, max S2 cloud cover % (0-100)
+        max_dim        : int, max width/height in pixels
+        s1_window_days : int, look-back window for the S1 acquisition of each step
+        config/client  : SHConfig or CDSEClient (as in get_sentinel_image_tensor)
+        cache          : SceneCache of the raw band rasters (new indices over the same
+                         bands need no new download)
+        max_workers    : int, scenes fetched concurrently
+        dtype          : numpy dtype of the returned tensor
+        out_path       : str or None, back the [C, T, H, W] buffer by a .npy memmap file
+
+    Returns:
+        torch.Tensor [1, len(layers), T, H, W], NaN where an index is undefined
+    """
+    if client is not None:
+        config = client.config
+    elif config is None:
+        from cdse_config import get_config
+        config = get_config()
+
+    layers = list(layers)
+    plan = plan_requests(layers)
+    collections = {key: collection(key, config.sh_base_url) for key in plan}
+
+    bbox = BBox(bbox=bbox_coords, crs=CRS.WGS84)
+    for res in [10, 20, 60, 100, 300]:
+        size = bbox_to_dimensions(bbox, resolution=res)
+        if size[0] <= max_dim and size[1] <= max_dim:
+            break
+    width, height = size
+
+    # Time steps
+    primary = "s2_l2a" if "s2_l2a" in plan else "s1_grd"
+    parent = current_span()
+    with span("catalog", collection=primary):
+        catalog = client if client is not None else SentinelHubCatalog(config=config)
+        dates = _select_dates(catalog, collections[primary], bbox, time_start, time_end, max_cloud, n_images)
+    if not dates:
+        raise ValueError("No cloud-free scenes found in selected range.")
+
+    shape = (len(layers), len(dates), height, width)
+    if out_path is not None:
+        buffer = np.lib.format.open_memmap(out_path, mode="w+", dtype=dtype, shape=shape)
+    else:
+        buffer = np.empty(shape, dtype=dtype)
+    evalscripts = {key: build_evalscript(bands, SAMPLE_TYPES[key]) for key, bands in plan.items()}
+
+    def fetch_raw(key, date):
+        bands, evalscript = plan[key], evalscripts[key]
+        if key == primary:
+            interval = (date, date)
+        else:
+            start = (dt.date.fromisoformat(date) - dt.timedelta(days=s1_window_days)).isoformat()
+            interval = (start, date)
+        cache_key = None
+        if cache is not None:
+            cache_key = make_scene_key(bbox_coords, f"{key}:{interval[0]}/{interval[1]}", bands, evalscript, res, size)
+            image = cache.get(cache_key)
+            if image is not None:
+                return image
+
+        input_kwargs = {"data_collection": collections[key], "time_interval": interval}
+        if key != primary:
+            input_kwargs["mosaicking_order"] = "mostRecent"
+        request = SentinelHubRequest(
+            evalscript=evalscript,
+            input_data=[SentinelHubRequest.input_data(**input_kwargs)],
+            responses=[SentinelHubRequest.output_response("default", MimeType.TIFF)],
+            bbox=bbox,
+            size=size,
+            config=config
+        )
+        with span("download", parent=parent, collection=key, date=date) as download_span:
+            if client is not None:
+                image = client.get_data(request)[0]
+            else:
+                image = get_data_with_backoff(request, max_retries=max_retries)[0]
+            download_span.add("bytes", image.nbytes)
+        image = image.reshape(height, width, len(bands))
+        if cache is not None:
+            cache.put(cache_key, image)
+        return image
+
+    def fetch_scene(t):
+        raw = {key: (list(plan[key]), fetch_raw(key, dates[t]).reshape(height, width, -1)) for key in plan}
+        with span("indices", parent=parent, date=dates[t]):
+            compute_indices(raw, layers, buffer[:, t])
+
+    if max_workers > 1 and len(dates) > 1:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(dates))) as executor:
+            list(executor.map(fetch_scene, range(len(dates))))
+    else:
+        for t in range(len(dates)):
+            fetch_scene(t)
+
+    return torch.from_numpy(buffer).unsqueeze(0)
+
+
+if __name__ == "__main__":
+    import time
+
+    # Kernel throughput on a 2048 x 2048 scene
+    rng = np.random.default_rng(0)
+    s2 = rng.integers(0, 10000, (2048, 2048, 3)).astype(np.uint16)  # B03, B04, B08
+    s1 = rng.gamma(1.0, 0.05, (2048, 2048, 1)).astype(np.float32)   # VV linear
+    raw = {"s2_l2a": (["B03", "B04", "B08"], s2), "s1_grd": (["VV"], s1)}
+    layers = ["NDVI", "NDWI", "VV_DB"]
+    out = np.empty((len(layers), 2048, 2048), dtype=np.float32)
+
+    start = time.perf_counter()
+    compute_indices(raw, layers, out)
+    print(f"{len(layers)} indices on 2048 x 2048: {(time.perf_counter() - start) * 1e3:.1f} ms")
+    print("Requests per scene:", plan_requests(layers))
+
+    sat_tensor = compute_layers(
+        bbox_coords=[24.54, 60.13, 25.15, 60.35],  # Helisinki
+        time_start="2024-08-01",
+        time_end="2024-10-01",
+        layers=["NDVI", "NDWI", "VV_DB", "B11", "B12"],
+        n_images=5
+    )
+    print("Layers tensor:", sat_tensor.shape)
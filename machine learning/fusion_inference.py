@@ -0,0 +1,177 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import torch
+
+from hybrid_fusion_pipeline import bucket_by_length
+
+
+def model_version(model: torch.nn.Module) -> str:
+    """
+    Short fingerprint of a model's weights, used to invalidate cached embeddings
+    whenever the model is retrained or reloaded with different parameters.
+    """
+    digest = hashlib.sha1()
+    for name, tensor in model.state_dict().items():
+        digest.update(name.encode("utf-8"))
+        digest.update(tensor.detach().cpu().contiguous().numpy().tobytes())
+    return digest.hexdigest()[:12]
+
+
+class SatelliteEmbeddingCache:
+    """
+    In-memory LRU cache of satellite embeddings keyed by (region, date window, model version).
+
+    Entries are evicted least recently used first once max_entries is exceeded, and
+    optionally expire after ttl_seconds so refreshed imagery is picked up. Concurrent
+    misses for the same key are single-flight: one caller computes, the others wait for
+    its result.
+    """
+
+    def __init__(self, max_entries=256, ttl_seconds=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (created_at, embedding)
+        self._inflight = {}  # key -> Future of the embedding being computed
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl_seconds is not None \
+                    and time.monotonic() - entry[0] > self.ttl_seconds:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, embedding):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), embedding)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, key, compute):
+        embedding = self.get(key)
+        if embedding is not None:
+            return embedding
+        with self._lock:
+            entry = self._entries.get(key)  # put by a computation that finished meanwhile
+            if entry is not None:
+                return entry[1]
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+        if not owner:
+            return future.result()
+
+        try:
+            embedding = compute()
+            self.put(key, embedding)
+            future.set_result(embedding)
+            return embedding
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+
+def get_satellite_embedding(model, region, date_window, sat_seq, cache, version=None, tile_size=None):
+    """
+    Returns the [1, embed_dim] satellite embedding of a region, running Satellite3DEncoder
+    only on a cache miss.
+
+    Args:
+        model       : HybridFusionModel
+        region      : hashable region id, e.g. "budapest" or a bbox tuple
+        date_window : hashable date window, e.g. ("2024-08-01", "2024-10-01")
+        sat_seq     : [1, C, T, H, W] tensor, or a zero-argument callable returning it
+                      (so a cache hit also skips fetching and preprocessing)
+        cache       : SatelliteEmbeddingCache
+        version     : model version string (defaults to model_version(model))
+        tile_size   : run Satellite3DEncoder.forward_tiled with this tile size (bounded
+                      memory for large rasters), None for the full-raster pass
+    """
+    if version is None:
+        version = model_version(model)
+    key = (region, tuple(date_window) if isinstance(date_window, list) else date_window, version)
+
+    def compute():
+        seq = sat_seq() if callable(sat_seq) else sat_seq
+        with torch.inference_mode():
+            if tile_size is not None:
+                return model.sat_encoder.forward_tiled(seq[:1], tile_size)
+            return model.sat_encoder(seq[:1])
+
+    return cache.get_or_compute(key, compute)
+
+
+def score_population(
+    model,
+    health_ts: torch.Tensor,
+    region,
+    date_window,
+    sat_seq,
+    cache: SatelliteEmbeddingCache,
+    batch_size: int = 4096,
+    version: str = None,
+    lengths: torch.Tensor = None
+) -> torch.Tensor:
+    """
+    Scores every patient of a region against one shared satellite embedding.
+
+    The Conv3d stack runs at most once per (region, date window, model version); each
+    patient batch only runs HealthEncoder and the classifier.
+
+    Args:
+        model       : HybridFusionModel (put in eval mode by the caller)
+        health_ts   : [N, T, F] preprocessed health series of the region's patients
+        region      : hashable region id
+        date_window : hashable date window of the satellite tensor
+        sat_seq     : [1, C, T, H, W] tensor or zero-argument callable returning it
+        cache       : SatelliteEmbeddingCache
+        batch_size  : patients per forward pass
+        version     : model version string (defaults to model_version(model))
+        lengths     : [N] true lengths of padded health series; patients are then
+                      bucketed by length and run as packed sequences
+
+    Returns:
+        torch.Tensor [N, num_classes] – class probabilities
+    """
+    s_embed = get_satellite_embedding(model, region, date_window, sat_seq, cache, version)
+
+    if lengths is None:
+        probs = []
+        with torch.inference_mode():
+            for start in range(0, health_ts.size(0), batch_size):
+                logits = model.forward_with_sat_embedding(health_ts[start:start + batch_size], s_embed)
+                probs.append(torch.softmax(logits, dim=1))
+        return torch.cat(probs)
+
+    lengths = torch.as_tensor(lengths)
+    probs = None
+    with torch.inference_mode():
+        for idx in bucket_by_length(lengths, batch_size):
+            batch_lengths = lengths[idx]
+            batch = health_ts[idx, :int(batch_lengths.max())]
+            p = torch.softmax(model.forward_with_sat_embedding(batch, s_embed, batch_lengths), dim=1)
+            if probs is None:
+                probs = p.new_empty(health_ts.size(0), p.size(1))
+            probs[idx] = p
+    return probs
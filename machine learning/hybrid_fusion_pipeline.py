@@ -1,15 +1,45 @@
 import torch
 import torch.nn as nn
+from torch.nn.utils.rnn import pack_padded_sequence, pad_sequence
+
+
+def pad_health_sequences(sequences):
+    """
+    Pads a list of [T_i, F] series into [B, T_max, F] and returns it with the [B] lengths.
+    """
+    lengths = torch.tensor([len(s) for s in sequences], dtype=torch.long)
+    return pad_sequence(list(sequences), batch_first=True), lengths
+
+
+def bucket_by_length(lengths, batch_size):
+    """
+    Groups sequence indices into batches of similar length (sorted, longest first) so
+    that padding inside each batch stays minimal.
+
+    Returns:
+        list of LongTensor index batches
+    """
+    order = torch.argsort(torch.as_tensor(lengths), descending=True, stable=True)
+    return list(torch.split(order, batch_size))
+
 
 class HealthEncoder(nn.Module):
     def __init__(self, input_dim, embed_dim):
         super().__init__()
         self.gru = nn.GRU(input_dim, embed_dim, batch_first=True)
 
-    def forward(self, x):  # [B, T, F]
+    def forward(self, x, lengths=None):  # [B, T, F], optional [B] true lengths
+        if lengths is not None:
+            # Packed sequences: no GRU compute on padding, h_n is each patient's last real step
+            x = pack_padded_sequence(x, torch.as_tensor(lengths).cpu(), batch_first=True, enforce_sorted=False)
         _, h_n = self.gru(x)
         return h_n.squeeze(0)  # [B, embed_dim]
 
+    def step(self, x_t, h=None):  # x_t: [B, F], h: [B, embed_dim] or None
+        # Advances the GRU by one reading; equals forward() on the full history
+        _, h_n = self.gru(x_t.unsqueeze(1), None if h is None else h.unsqueeze(0))
+        return h_n.squeeze(0)  # [B, embed_dim]
+
 class Satellite3DEncoder(nn.Module):
     def __init__(self, input_channels, embed_dim):
         super().__init__()
@@ -26,6 +56,47 @@ class Satellite3DEncoder(nn.Module):
         x = x.view(x.size(0), -1)  # → [B, 32]
         return self.fc(x)  # → [B, embed_dim]
 
+    def forward_tiled(self, x, tile_size=256):  # [B, C, T, H, W]
+        """
+        Same result as forward(), computed over overlapping spatial tiles so peak
+        activation memory depends on tile_size instead of H x W.
+
+        Each output tile (in pooled coordinates) is computed from an input window with a
+        3-pixel halo (conv1 + pool + conv2 receptive field); halo outputs are cropped and
+        the global average pool is accumulated as a running sum. x may be a view of a
+        memory-mapped tensor, only one tile is materialized at a time.
+        """
+        conv1, relu1, pool, conv2, relu2, _ = self.encoder
+        B, _, T, H, W = x.shape
+        Hp, Wp = H // 2, W // 2  # MaxPool3d((1, 2, 2)) floors odd sizes
+        step = max(1, tile_size // 2)
+
+        def window(a, b, size, pooled_size):
+            # pooled rows [a, b) need pooled rows [a - 1, b + 1) from conv2's padding,
+            # which need input rows [2a' - 1, 2b' + 1) from conv1's padding
+            pa, pb = max(a - 1, 0), min(b + 1, pooled_size)
+            return pa, pb, max(2 * pa - 1, 0), min(2 * pb + 1, size)
+
+        total = None
+        for y0 in range(0, Hp, step):
+            y1 = min(y0 + step, Hp)
+            pya, pyb, iya, iyb = window(y0, y1, H, Hp)
+            for x0 in range(0, Wp, step):
+                x1 = min(x0 + step, Wp)
+                pxa, pxb, ixa, ixb = window(x0, x1, W, Wp)
+
+                tile = x[:, :, :, iya:iyb, ixa:ixb]
+                h = relu1(conv1(tile))
+                h = h[:, :, :, 2 * pya - iya:2 * pyb - iya, 2 * pxa - ixa:2 * pxb - ixa]
+                h = relu2(conv2(pool(h)))
+                h = h[:, :, :, y0 - pya:y1 - pya, x0 - pxa:x1 - pxa]
+
+                partial = h.sum(dim=(2, 3, 4))
+                total = partial if total is None else total + partial
+
+        pooled = total / (T * Hp * Wp)  # → [B, 32]
+        return self.fc(pooled)  # → [B, embed_dim]
+
 class HybridFusionModel(nn.Module):
     def __init__(self, health_input_dim, sat_input_channels, embed_dim, num_classes):
         super().__init__()
@@ -38,10 +109,17 @@ class HybridFusionModel(nn.Module):
             nn.Linear(64, num_classes)
         )
 
-    def forward(self, health_ts, sat_seq):  
+    def forward(self, health_ts, sat_seq, lengths=None):  
         # health_ts: [B, T_h, F]  
         # sat_seq:   [B, C, T_s, H, W]
-        h_embed = self.health_encoder(health_ts)
+        # lengths:   [B] true lengths of padded health series (optional)
         s_embed = self.sat_encoder(sat_seq)
+        return self.forward_with_sat_embedding(health_ts, s_embed, lengths)
+
+    def forward_with_sat_embedding(self, health_ts, s_embed, lengths=None):
+        # health_ts: [B, T_h, F]
+        # s_embed:   [B, embed_dim] or [1, embed_dim] shared by the whole batch
+        h_embed = self.health_encoder(health_ts, lengths)
+        s_embed = s_embed.expand(h_embed.size(0), -1)
         fused = torch.cat([h_embed, s_embed], dim=1)
         return self.classifier(fused)
@@ -1,12 +1,128 @@
+import time
+import random
+from concurrent.futures import ThreadPoolExecutor
+
 import torch
 import numpy as np
 from sentinelhub import (
     SHConfig, BBox, CRS, SentinelHubRequest, DataCollection,
     MimeType, bbox_to_dimensions, SentinelHubCatalog
 )
-import matplotlib.pyplot as plt
+from sentinelhub.exceptions import DownloadFailedException
+from scene_cache import make_scene_key
+from cdse_client import CDSE_URL, collection
+from instrumentation import current_span, span, traced
+
+
+def s2_l2a_collection(service_url=CDSE_URL):
+    """
+    Sentinel-2 L2A collection served from service_url (CDSE, or a stand-in with the same
+    API such as cdse_standin). Defined once per URL; later calls return the same enum.
+    """
+    return collection("s2_l2a", service_url)
+
+
+def _is_rate_limited(exc):
+    """
+    True if a failed download was rejected with HTTP 429 (Too Many Requests).
+    """
+    while exc is not None:
+        response = getattr(exc, "response", None)
+        if getattr(response, "status_code", None) == 429:
+            return True
+        exc = getattr(exc, "request_exception", None) or exc.__cause__
+    return False
+
+
+def get_data_with_backoff(request, max_retries=5, base_delay=1.0, max_delay=60.0):
+    """
+    Runs request.get_data(), retrying with exponential backoff and jitter when CDSE
+    answers 429. Any other error is raised immediately.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return request.get_data()
+        except DownloadFailedException as e:
+            if attempt == max_retries or not _is_rate_limited(e):
+                raise
+            delay = min(max_delay, base_delay * 2 ** attempt)
+            time.sleep(delay * (0.5 + random.random() / 2))
+
+
+# Input units per supported output sample type: UINT16 needs digital numbers, since
+# reflectance (0-1) would be truncated to 0/1; UINT8 cannot hold either without scaling
+SAMPLE_UNITS = {"UINT16": ', units: "DN"', "FLOAT32": ""}
+
+
+def _sample_units(sample_type):
+    if sample_type not in SAMPLE_UNITS:
+        raise ValueError(f"Unsupported sample_type {sample_type!r}, use one of {sorted(SAMPLE_UNITS)}")
+    return SAMPLE_UNITS[sample_type]
 
 
+def build_evalscript(bands, sample_type="UINT16"):
+    """
+    Builds a single-date evalscript returning the raw bands with a compact sample type.
+
+    UINT16 requests digital numbers (reflectance x 10000), which is lossless and half the
+    size of FLOAT32; FLOAT32 returns reflectance.
+    """
+    units = _sample_units(sample_type)
+    return f"""
+    //VERSION=3
+    function setup() {{
+      return {{
+        input: [{{ bands: [{', '.join([f'"{b}"' for b in bands])}]{units} }}],
+        output: {{ bands: {len(bands)}, sampleType: "{sample_type}" }}
+      }};
+    }}
+    function evaluatePixel(sample) {{
+      return [{', '.join([f'sample.{b}' for b in bands])}];
+    }}
+    """
+
+
+def build_multitemporal_evalscript(bands, dates, sample_type="UINT16"):
+    """
+    Builds an ORBIT-mosaicking evalscript that returns every date x band in one raster.
+
+    Output band t * C + c holds band c of dates[t]; dates without valid data stay 0.
+    """
+    units = _sample_units(sample_type)
+    n_bands = len(bands)
+    assignments = "\n".join(
+        f"        out[t * {n_bands} + {c}] = samples[i].{b};" for c, b in enumerate(bands)
+    )
+    return f"""
+    //VERSION=3
+    var DATES = [{', '.join([f'"{d}"' for d in dates])}];
+    function setup() {{
+      return {{
+        input: [{{ bands: [{', '.join([f'"{b}"' for b in bands])}, "dataMask"]{units} }}],
+        output: {{ bands: {n_bands * len(dates)}, sampleType: "{sample_type}" }},
+        mosaicking: "ORBIT"
+      }};
+    }}
+    function preProcessScenes(collections) {{
+      collections.scenes.orbits = collections.scenes.orbits.filter(function (orbit) {{
+        return DATES.indexOf(orbit.dateFrom.slice(0, 10)) !== -1;
+      }});
+      return collections;
+    }}
+    function evaluatePixel(samples, scenes) {{
+      var out = new Array({n_bands * len(dates)}).fill(0);
+      for (var i = 0; i < samples.length; i++) {{
+        if (samples[i].dataMask === 0) continue;
+        var t = DATES.indexOf(scenes.orbits[i].dateFrom.slice(0, 10));
+        if (t === -1) continue;
+{assignments}
+      }}
+      return out;
+    }}
+    """
+
+
+@traced()
 def get_sentinel_image_tensor(
     bbox_coords,
     time_start,
@@ -16,7 +132,17 @@ def get_sentinel_image_tensor(
     bands=("B03", "B11", "B12"),
     max_dim=512,
     config=None,
-    visualize=True
+    visualize=False,
+    cache=None,
+    max_workers=4,
+    max_retries=5,
+    single_request=False,
+    sample_type="UINT16",
+    dtype=np.float32,
+    out_path=None,
+    scene_index=None,
+    thumbnails=None,
+    client=None
 ):
     """
     Downloads cloud-free Sentinel-2 images and returns a tensor of shape [1, C, T, H, W].
@@ -30,14 +156,29 @@ def get_sentinel_image_tensor(
         bands        : tuple   Sentinel-2 band names
         max_dim      : int     max width/height in pixels
         config       : SHConfig or None
-        visualize    : bool    whether to show a grid of the images
+        visualize    : bool    whether to show a grid of the images (interactive, blocks)
+        cache        : SceneCache or None, on-disk scene cache reused across runs
+        max_workers  : int     number of dates downloaded concurrently (1 = sequential)
+        max_retries  : int     retries per date when rate limited (HTTP 429)
+        single_request : bool  fetch all dates in one multi-temporal (ORBIT) request
+        sample_type  : str     "UINT16" (digital numbers) or "FLOAT32" (reflectance)
+        dtype        : numpy dtype of the returned tensor (e.g. np.float16 to halve RAM)
+        out_path     : str or None, back the [C, T, H, W] buffer by a .npy memmap file
+        scene_index  : SceneIndex or None, persisted catalog index; only dates not indexed
+                       yet are searched and scenes are selected locally
+        thumbnails   : ThumbnailWriter or None, writes a PNG per date in the background
+        client       : CDSEClient or None, runs catalog and process requests with its cached
+                       token and pooled session (its config replaces `config`)
 
     Returns:
         torch.Tensor [1, C, T, H, W]
     """
-    if config is None:
+    if client is not None:
+        config = client.config
+    elif config is None:
         from cdse_config import get_config
         config = get_config()
+    _sample_units(sample_type)  # fail on an unsupported sample type before any request
 
     bbox = BBox(bbox=bbox_coords, crs=CRS.WGS84)
 
@@ -47,73 +188,133 @@ def get_sentinel_image_tensor(
         if size[0] <= max_dim and size[1] <= max_dim:
             break
 
-    # Data collection
-    data_collection = DataCollection.define(
-        name="cdse_s2_l2a",
-        api_id="sentinel-2-l2a",
-        service_url="https://sh.dataspace.copernicus.eu"
-    )
+    # Data collection (process requests follow the data collection's service URL)
+    data_collection = s2_l2a_collection(config.sh_base_url)
 
     # Get available low-cloud dates
-    catalog = SentinelHubCatalog(config=config)
-    search_iterator = catalog.search(
-        collection=data_collection,
-        bbox=bbox,
-        time=(time_start, time_end),
-        filter={
-            "op": "<=",
-            "args": [{"property": "eo:cloud_cover"}, max_cloud]
-        },
-        filter_lang="cql2-json",
-        distinct="date"
-    )
-    available_dates = list(search_iterator)
+    parent = current_span()
+    with span("catalog", scene_index=scene_index is not None) as catalog_span:
+        catalog = client if client is not None else SentinelHubCatalog(config=config)
+        if scene_index is not None:
+            scene_index.sync(catalog, data_collection, bbox, bbox_coords, time_start, time_end)
+            available_dates = scene_index.select_dates(
+                data_collection, bbox_coords, time_start, time_end, max_cloud=max_cloud
+            )
+        else:
+            search_iterator = catalog.search(
+                collection=data_collection,
+                bbox=bbox,
+                time=(time_start, time_end),
+                filter={
+                    "op": "<=",
+                    "args": [{"property": "eo:cloud_cover"}, max_cloud]
+                },
+                filter_lang="cql2-json",
+                distinct="date"
+            )
+            available_dates = list(search_iterator)
+        catalog_span.set("n_dates", len(available_dates))
     selected_dates = available_dates[:n_images]
     if not selected_dates:
         raise ValueError("No cloud-free scenes found in selected range.")
 
     # Evalscript generation
-    evalscript = f"""
-    //VERSION=3
-    function setup() {{
-      return {{
-        input: [{', '.join([f'"{b}"' for b in bands])}],
-        output: {{ bands: {len(bands)} }}
-      }};
-    }}
-    function evaluatePixel(sample) {{
-      return [{', '.join([f'sample.{b}' for b in bands])}];
-    }}
-    """
+    evalscript = build_evalscript(bands, sample_type)
+
+    # Preallocated [C, T, H, W] buffer, every scene is written into it exactly once
+    width, height = size
+    shape = (len(bands), len(selected_dates), height, width)
+    if out_path is not None:
+        buffer = np.lib.format.open_memmap(out_path, mode="w+", dtype=dtype, shape=shape)
+    else:
+        buffer = np.empty(shape, dtype=dtype)
+
+    def _download(request):
+        if client is not None:
+            return client.get_data(request)[0]
+        return get_data_with_backoff(request, max_retries=max_retries)[0]
+
+    # Download images (in parallel, each worker writes its own time slice)
+    def fetch_scene(t):
+        date = selected_dates[t]
+        image = None
+        if cache is not None:
+            key = make_scene_key(bbox_coords, date, bands, evalscript, res, size)
+            image = cache.get(key)
 
-    # Download images
-    image_stack = []
-    for date in selected_dates:
-        request = SentinelHubRequest(
-            evalscript=evalscript,
-            input_data=[SentinelHubRequest.input_data(
-                data_collection=data_collection,
-                time_interval=(date, date)
-            )],
-            responses=[SentinelHubRequest.output_response("default", MimeType.TIFF)],
-            bbox=bbox,
-            size=size,
-            config=config
-        )
-        image = request.get_data()[0]
-        image_stack.append(image)
-
-    # Reformat to [1, C, T, H, W]
-    stack_array = np.stack(image_stack)  # [T, H, W, C]
-    stack_tensor = torch.tensor(stack_array.transpose(0, 3, 1, 2), dtype=torch.float32)  # [T, C, H, W]
-    stack_tensor = stack_tensor.permute(1, 0, 2, 3).unsqueeze(0)  # [1, C, T, H, W]
+        if image is None:
+            request = SentinelHubRequest(
+                evalscript=evalscript,
+                input_data=[SentinelHubRequest.input_data(
+                    data_collection=data_collection,
+                    time_interval=(date, date)
+                )],
+                responses=[SentinelHubRequest.output_response("default", MimeType.TIFF)],
+                bbox=bbox,
+                size=size,
+                config=config
+            )
+            with span("download", parent=parent, date=date) as download_span:
+                image = _download(request)
+                download_span.add("bytes", image.nbytes)
+            if cache is not None:
+                cache.put(key, image)
 
+        with span("reshape", parent=parent, date=date):
+            buffer[:, t] = np.moveaxis(image.reshape(height, width, -1), -1, 0)  # [H, W, C] -> [C, H, W]
+
+    def fetch_all_dates():
+        # One request for all dates: [H, W, T * C] unpacked into [C, T, H, W]
+        mt_evalscript = build_multitemporal_evalscript(bands, selected_dates, sample_type)
+        image = None
+        if cache is not None:
+            key = make_scene_key(bbox_coords, ",".join(selected_dates), bands, mt_evalscript, res, size)
+            image = cache.get(key)
+
+        if image is None:
+            request = SentinelHubRequest(
+                evalscript=mt_evalscript,
+                input_data=[SentinelHubRequest.input_data(
+                    data_collection=data_collection,
+                    time_interval=(selected_dates[0], selected_dates[-1])
+                )],
+                responses=[SentinelHubRequest.output_response("default", MimeType.TIFF)],
+                bbox=bbox,
+                size=size,
+                config=config
+            )
+            with span("download", parent=parent, dates=len(selected_dates)) as download_span:
+                image = _download(request)
+                download_span.add("bytes", image.nbytes)
+            if cache is not None:
+                cache.put(key, image)
+
+        with span("reshape", parent=parent):
+            buffer[:] = image.reshape(height, width, len(selected_dates), len(bands)).transpose(3, 2, 0, 1)
+
+    if single_request:
+        fetch_all_dates()
+    elif max_workers > 1 and len(selected_dates) > 1:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(selected_dates))) as executor:
+            list(executor.map(fetch_scene, range(len(selected_dates))))
+    else:
+        for t in range(len(selected_dates)):
+            fetch_scene(t)
+
+    # Zero-copy view as [1, C, T, H, W]
+    stack_tensor = torch.from_numpy(buffer).unsqueeze(0)
+
+    if thumbnails is not None:
+        thumbnails.submit_scenes(buffer, selected_dates, prefix="_".join(f"{c:g}" for c in bbox_coords))
 
     if visualize:
+        import matplotlib.pyplot as plt
+
         rows = (n_images + 2) // 3
         fig, axes = plt.subplots(rows, 3, figsize=(15, 5 * rows))
-        for i, (ax, img, date) in enumerate(zip(axes.flat, stack_array, selected_dates)):
-            norm_img = np.clip(img / np.max(img), 0, 1)  # img is already [H, W, C]
+        for i, (ax, date) in enumerate(zip(axes.flat, selected_dates)):
+            img = np.moveaxis(buffer[:, i], 0, -1).astype(np.float32)  # [H, W, C]
+            norm_img = np.clip(img / np.max(img), 0, 1)
             ax.imshow(norm_img)
             ax.set_title(f"Date: {date}")
             ax.axis("off")
@@ -125,10 +326,20 @@ def get_sentinel_image_tensor(
     return stack_tensor
 
 if __name__ == "__main__":
-        sat_tensor = get_sentinel_image_tensor(
-            bbox_coords=[24.54, 60.13, 25.15, 60.35],  # Helisinki
-            time_start="2024-08-01",
-            time_end="2024-10-01",
-            n_images=5,
-            visualize=True
-        )
+        from scene_cache import SceneCache
+        from scene_index import SceneIndex
+        from visualization import ThumbnailWriter
+
+        cache = SceneCache()
+        with ThumbnailWriter("thumbnails") as thumbnails:
+            sat_tensor = get_sentinel_image_tensor(
+                bbox_coords=[24.54, 60.13, 25.15, 60.35],  # Helisinki
+                time_start="2024-08-01",
+                time_end="2024-10-01",
+                n_images=5,
+                cache=cache,
+                scene_index=SceneIndex(),
+                thumbnails=thumbnails
+            )
+        print("Scene cache:", cache.stats())
+        print("Thumbnails:", thumbnails.written)
@@ -0,0 +1,342 @@
+import functools
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+
+
+_enabled = False
+_records = []
+_records_lock = threading.Lock()
+_local = threading.local()
+_ids = itertools.count(1)
+_sampler = None
+
+
+def _current_rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:  # no procfs (macOS, Windows): RSS is not reported
+        return 0
+
+
+class _RSSSampler:
+    """
+    Background thread updating the peak RSS of every open span.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.open_spans = set()
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            rss = _current_rss_bytes()
+            with self.lock:
+                for span in self.open_spans:
+                    span.peak_rss = max(span.peak_rss, rss)
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+class Span:
+    """
+    One timed stage. Attributes set with set() / add() / tensor() end up in the record.
+    """
+
+    def __init__(self, name, parent=None, **attrs):
+        self.name = name
+        self.parent = parent if parent is not None else current_span()
+        self.path = f"{self.parent.path}/{name}" if self.parent is not None else name
+        self.span_id = next(_ids)
+        self.attrs = dict(attrs)
+
+    def set(self, key, value):
+        self.attrs[key] = value
+
+    def add(self, key, value):
+        self.attrs[key] = self.attrs.get(key, 0) + value
+
+    def tensor(self, key, t):
+        """
+        Records the shape and size in bytes of a tensor / ndarray.
+        """
+        nbytes = t.numel() * t.element_size() if hasattr(t, "element_size") else t.nbytes
+        self.attrs[f"{key}_shape"] = list(t.shape)
+        self.attrs[f"{key}_bytes"] = int(nbytes)
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        stack.append(self)
+        self.rss_start = self.peak_rss = _current_rss_bytes()
+        if _sampler is not None:
+            with _sampler.lock:
+                _sampler.open_spans.add(self)
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self._t0
+        if _sampler is not None:
+            with _sampler.lock:
+                _sampler.open_spans.discard(self)
+        self.peak_rss = max(self.peak_rss, _current_rss_bytes())
+        _local.stack.remove(self)
+
+        record = {
+            "name": self.name,
+            "path": self.path,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent is not None else None,
+            "thread": threading.current_thread().name,
+            "start": self.start,
+            "wall_ms": wall * 1000,
+            "rss_start_mb": self.rss_start / 1024 ** 2,
+            "peak_rss_mb": self.peak_rss / 1024 ** 2,
+            "error": exc_type.__name__ if exc_type is not None else None,
+            **self.attrs,
+        }
+        with _records_lock:
+            _records.append(record)
+        return False
+
+
+class _NoOpSpan:
+    """
+    Shared span returned while instrumentation is disabled; every call is a no-op.
+    """
+
+    path = ""
+    span_id = None
+
+    def set(self, key, value):
+        pass
+
+    def add(self, key, value):
+        pass
+
+    def tensor(self, key, t):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoOpSpan()
+
+
+def enable(rss_interval=0.005):
+    """
+    Turns span recording on (and starts the peak-RSS sampler, unless rss_interval=None).
+    """
+    global _enabled, _sampler
+    if rss_interval is not None and _sampler is None:
+        _sampler = _RSSSampler(rss_interval)
+    _enabled = True
+
+
+def disable():
+    global _enabled, _sampler
+    _enabled = False
+    if _sampler is not None:
+        _sampler.stop()
+        _sampler = None
+
+
+def is_enabled():
+    return _enabled
+
+
+def span(name, parent=None, **attrs):
+    """
+    Context manager timing a stage, nested under the current span of this thread (or
+    under `parent`, e.g. a span captured before handing work to a thread pool).
+
+        with span("catalog") as s:
+            ...
+            s.set("n_dates", len(dates))
+    """
+    if not _enabled:
+        return _NOOP
+    return Span(name, parent=parent if parent is not _NOOP else None, **attrs)
+
+
+def current_span():
+    stack = getattr(_local, "stack", None)
+    return stack[-1] if stack else None
+
+
+def traced(name=None):
+    """
+    Decorator running the function inside a span. The first tensor argument and a tensor
+    result are recorded as "input" / "output" shapes and bytes.
+    """
+    def decorator(fn):
+        span_name = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with Span(span_name) as s:
+                if args and hasattr(args[0], "shape"):
+                    s.tensor("input", args[0])
+                result = fn(*args, **kwargs)
+                if hasattr(result, "shape"):
+                    s.tensor("output", result)
+                return result
+
+        return wrapper
+
+    return decorator
+
+
+def _module_spans(module):
+    # Per-thread stack of the open spans of a module (re-entrant and thread-safe)
+    stacks = getattr(_local, "module_spans", None)
+    if stacks is None:
+        stacks = _local.module_spans = {}
+    return stacks.setdefault(id(module), [])
+
+
+class _SpanPreHook:
+    """
+    Forward pre-hook opening a span; a module-level class so instrumented models can
+    still be deep-copied and pickled.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __call__(self, module, inputs):
+        if not _enabled:
+            _module_spans(module).append(None)
+            return
+        s = Span(self.name)
+        tensors = [x for x in inputs if hasattr(x, "shape")]
+        if tensors:
+            s.tensor("input", tensors[0])
+        _module_spans(module).append(s.__enter__())
+
+
+class _SpanPostHook:
+    """
+    Forward hook closing the span of _SpanPreHook. Registered with always_call=True, so
+    it also runs when forward raises (the span then records the error).
+    """
+
+    def __call__(self, module, inputs, output):
+        stack = _module_spans(module)
+        if not stack:  # instrumented while this forward was already running
+            return
+        s = stack.pop()
+        if s is None:
+            return
+        exc_type, exc, tb = sys.exc_info()
+        if exc_type is None and hasattr(output, "shape"):
+            s.tensor("output", output)
+        s.__exit__(exc_type, exc, tb)
+
+
+def instrument_module(model, prefix=None, depth=1):
+    """
+    Wraps the forward pass of a module and of its submodules (down to `depth` levels,
+    e.g. HybridFusionModel -> health_encoder / sat_encoder / classifier) in spans
+    using forward hooks. The hooks only check a flag while instrumentation is disabled.
+
+    Open spans are kept per thread, so the same model can run on several threads, and a
+    forward that raises still closes its span. The hooks are picklable objects, so deep
+    copies (e.g. optimize_for_cpu) and saved models stay instrumented on their own.
+
+    Returns:
+        list of hook handles (call .remove() on each to uninstrument)
+    """
+    prefix = prefix or type(model).__name__
+    handles = []
+
+    def attach(module, name):
+        handles.append(module.register_forward_pre_hook(_SpanPreHook(name)))
+        handles.append(module.register_forward_hook(_SpanPostHook(), always_call=True))
+
+    attach(model, prefix)
+    for child_name, child in model.named_modules():
+        if child_name and child_name.count(".") < depth:
+            attach(child, child_name.split(".")[-1])
+    return handles
+
+
+def records(clear=False):
+    with _records_lock:
+        out = list(_records)
+        if clear:
+            _records.clear()
+    return out
+
+
+def reset():
+    records(clear=True)
+
+
+def write_jsonl(path, clear=False):
+    """
+    Appends the finished spans to a JSON lines file, one span per line.
+    """
+    with open(path, "a") as f:
+        for record in records(clear=clear):
+            f.write(json.dumps(record) + "\n")
+
+
+def to_prometheus(prefix="healthradar"):
+    """
+    Aggregates the finished spans per path into Prometheus text exposition format.
+    """
+    totals = {}
+    for r in records():
+        t = totals.setdefault(r["path"], {"count": 0, "seconds": 0.0, "bytes": 0, "peak_rss": 0.0, "errors": 0})
+        t["count"] += 1
+        t["seconds"] += r["wall_ms"] / 1000
+        t["bytes"] += r.get("bytes", 0)
+        t["peak_rss"] = max(t["peak_rss"], r["peak_rss_mb"] * 1024 ** 2)
+        t["errors"] += r["error"] is not None
+
+    metrics = [
+        ("span_count_total", "counter", "Finished spans", "count"),
+        ("span_seconds_total", "counter", "Wall time spent in spans", "seconds"),
+        ("span_bytes_total", "counter", "Bytes downloaded inside spans", "bytes"),
+        ("span_peak_rss_bytes", "gauge", "Peak resident set size observed during a span", "peak_rss"),
+        ("span_errors_total", "counter", "Spans that ended with an exception", "errors"),
+    ]
+    lines = []
+    for metric, kind, help_text, key in metrics:
+        lines.append(f"# HELP {prefix}_{metric} {help_text}")
+        lines.append(f"# TYPE {prefix}_{metric} {kind}")
+        for path, t in sorted(totals.items()):
+            lines.append(f'{prefix}_{metric}{{span="{path}"}} {t[key]:g}')
+    return "\n".join(lines) + "\n"
+
+
+def summary():
+    """
+    Per-path count / total / mean wall time, longest first (for quick printing).
+    """
+    totals = {}
+    for r in records():
+        count, total = totals.get(r["path"], (0, 0.0))
+        totals[r["path"]] = (count + 1, total + r["wall_ms"])
+    rows = sorted(totals.items(), key=lambda kv: -kv[1][1])
+    return "\n".join(f"{path:55s} {n:5d}x {total:10.1f} ms  (mean {total / n:.1f} ms)" for path, (n, total) in rows)
@@ -1,34 +1,35 @@
+import os
 import torch
 import numpy as np
-import matplotlib.pyplot as plt
-from sentinelhub import (
-    SHConfig, BBox, CRS, SentinelHubRequest, DataCollection,
-    MimeType, bbox_to_dimensions, SentinelHubCatalog
-)
 from hybrid_fusion_pipeline import HybridFusionModel
 from hystorical_satellite_fetcher import get_sentinel_image_tensor
 from preprocess_satellite_data import preprocess_satellite_data
-from preprocess_health_data import preprocess_health_data, downsample_health_to_satellite_times
+from preprocess_health_data import preprocess_health_data_batched, downsample_health_to_satellite_times
+import instrumentation
 
 # --- Entry point ---
 if __name__ == "__main__":
+    # Stage timings: HEALTHRADAR_TRACE=trace.jsonl python main.py (also writes trace.prom)
+    trace_path = os.environ.get("HEALTHRADAR_TRACE")
+    if trace_path:
+        instrumentation.enable()
+
     # Step 1: Fetch satellite data tensor [1, C, T, H, W]
     sat_raw = get_sentinel_image_tensor(
         bbox_coords=[19.00, 47.35, 19.10, 47.45],  # Budapest
         time_start="2024-08-01",
         time_end="2024-10-01",
-        n_images=5,
-        visualize=True
+        n_images=5
     )
 
-    sat_clean = preprocess_satellite_data(sat_raw, selected_channels=[0, 1, 2], norm_type="zscore")
+    sat_clean = preprocess_satellite_data(sat_raw, selected_channels=[0, 1, 2], norm_type="zscore", inplace=True)
 
     # Step 2: Generate dummy health data [1, T, F]
     B, C, T, H, W = sat_clean.shape
     HEALTH_FEATURES = 3
     health_raw = torch.randn(B, T, HEALTH_FEATURES)
 
-    health_clean = preprocess_health_data(health_raw)
+    health_clean = preprocess_health_data_batched(health_raw)
     #downsample_health_to_satellite_times
 
     # Step 3: Create and run model
@@ -39,6 +40,7 @@ if __name__ == "__main__":
         num_classes=2
     )
     model.eval()
+    instrumentation.instrument_module(model)
 
     with torch.no_grad():
         output = model(health_clean, sat_clean)
@@ -48,3 +50,9 @@ if __name__ == "__main__":
         print("Logits:", output)
         print("Probabilities:", probs)
         print("Predicted class:", pred)
+
+    if trace_path:
+        instrumentation.write_jsonl(trace_path)
+        with open(os.path.splitext(trace_path)[0] + ".prom", "w") as f:
+            f.write(instrumentation.to_prometheus())
+        print(instrumentation.summary())
@@ -0,0 +1,194 @@
+import argparse
+import copy
+import io
+import os
+import threading
+import time
+
+import torch
+import torch.nn as nn
+from torch.ao.quantization import quantize_dynamic
+
+from hybrid_fusion_pipeline import HybridFusionModel
+
+
+class OptimizedFusionModel(nn.Module):
+    """
+    CPU inference wrapper around HybridFusionModel.
+
+    Converts the satellite input to the channels-last-3d layout (and optionally bf16)
+    before the Conv3d stack and casts the satellite embedding back to float32, so the
+    (possibly int8-quantized) health encoder and classifier always see float32.
+    """
+
+    def __init__(self, model, channels_last=True, bf16=False):
+        super().__init__()
+        self.model = model
+        self.channels_last = channels_last
+        self.sat_dtype = torch.bfloat16 if bf16 else torch.float32
+
+    def forward(self, health_ts, sat_seq):
+        if self.channels_last:
+            sat_seq = sat_seq.contiguous(memory_format=torch.channels_last_3d)
+        s_embed = self.model.sat_encoder(sat_seq.to(self.sat_dtype)).float()
+        return self.model.forward_with_sat_embedding(health_ts, s_embed)
+
+
+def optimize_for_cpu(model, example_inputs, quantize=True, trace=True, channels_last=True, bf16=False):
+    """
+    Builds an optimized inference copy of a HybridFusionModel.
+
+    Args:
+        model          : HybridFusionModel (float32, left untouched)
+        example_inputs : (health_ts [B, T, F], sat_seq [B, C, T, H, W]) used for tracing
+        quantize       : dynamic int8 quantization of the GRU and Linear layers
+        trace          : trace and freeze the model into a TorchScript graph
+        channels_last  : channels-last-3d memory layout for the Satellite3DEncoder convs
+        bf16           : run the Satellite3DEncoder in bfloat16
+
+    Returns:
+        nn.Module or torch.jit.ScriptModule with the forward(health_ts, sat_seq) signature
+    """
+    model = copy.deepcopy(model).eval()
+
+    if channels_last:
+        model.sat_encoder.to(memory_format=torch.channels_last_3d)
+    if bf16:
+        model.sat_encoder.to(torch.bfloat16)
+    if quantize:
+        model.health_encoder = quantize_dynamic(model.health_encoder, {nn.GRU}, dtype=torch.qint8)
+        model.classifier = quantize_dynamic(model.classifier, {nn.Linear}, dtype=torch.qint8)
+        if not bf16:
+            model.sat_encoder.fc = quantize_dynamic(
+                nn.Sequential(model.sat_encoder.fc), {nn.Linear}, dtype=torch.qint8
+            )[0]
+
+    optimized = OptimizedFusionModel(model, channels_last=channels_last, bf16=bf16).eval()
+    if trace:
+        with torch.inference_mode():
+            optimized = torch.jit.freeze(torch.jit.trace(optimized, example_inputs))
+    return optimized
+
+
+def save_optimized(optimized, path):
+    if isinstance(optimized, torch.jit.ScriptModule):
+        torch.jit.save(optimized, path)
+    else:
+        torch.save(optimized, path)
+
+
+def accuracy_drift(reference, optimized, inputs):
+    """
+    Compares the optimized model with the float model on the same inputs.
+
+    Returns:
+        dict with the max absolute probability difference and the predicted-class agreement
+    """
+    with torch.inference_mode():
+        ref = torch.softmax(reference(*inputs), dim=1)
+        opt = torch.softmax(optimized(*inputs).float(), dim=1)
+    return {
+        "max_abs_prob_diff": (ref - opt).abs().max().item(),
+        "class_agreement": (ref.argmax(1) == opt.argmax(1)).float().mean().item(),
+    }
+
+
+def _current_rss_bytes():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+class PeakRSSSampler:
+    """
+    Samples the resident set size in a background thread and keeps the peak growth
+    over the value at entry (ru_maxrss can only grow, so it is useless across runs).
+    """
+
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.peak_growth = 0
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak_growth = max(self.peak_growth, _current_rss_bytes() - self._baseline)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._baseline = _current_rss_bytes()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def benchmark(model, make_inputs, batch_sizes=(1, 8, 32, 128), warmup=3, iterations=20):
+    """
+    Measures mean latency per batch and peak RSS growth for each batch size.
+
+    Args:
+        model       : callable(health_ts, sat_seq)
+        make_inputs : callable(batch_size) -> (health_ts, sat_seq)
+    """
+    results = []
+    for batch_size in batch_sizes:
+        inputs = make_inputs(batch_size)
+        with torch.inference_mode(), PeakRSSSampler() as rss:
+            for _ in range(warmup):
+                model(*inputs)
+            start = time.perf_counter()
+            for _ in range(iterations):
+                model(*inputs)
+            elapsed = (time.perf_counter() - start) / iterations
+        results.append({
+            "batch_size": batch_size,
+            "latency_ms": elapsed * 1000,
+            "samples_per_sec": batch_size / elapsed,
+            "peak_rss_growth_mb": rss.peak_growth / 1024 ** 2,
+        })
+    return results
+
+
+def serialized_size_mb(optimized):
+    buffer = io.BytesIO()
+    save_optimized(optimized, buffer)
+    return buffer.tell() / 1024 ** 2
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export an optimized CPU inference artifact")
+    parser.add_argument("--weights", default=None, help="state_dict of a trained HybridFusionModel")
+    parser.add_argument("--out", default="hybrid_fusion_cpu.pt")
+    parser.add_argument("--no-quantize", action="store_true")
+    parser.add_argument("--no-trace", action="store_true")
+    parser.add_argument("--no-channels-last", action="store_true")
+    parser.add_argument("--bf16", action="store_true")
+    args = parser.parse_args()
+
+    HEALTH_FEATURES, C, T, H, W = 6, 3, 5, 64, 64
+    model = HybridFusionModel(health_input_dim=HEALTH_FEATURES, sat_input_channels=C, embed_dim=16, num_classes=2)
+    if args.weights:
+        model.load_state_dict(torch.load(args.weights))
+    model.eval()
+
+    def make_inputs(batch_size):
+        return torch.randn(batch_size, 48, HEALTH_FEATURES), torch.randn(batch_size, C, T, H, W)
+
+    optimized = optimize_for_cpu(
+        model, make_inputs(4),
+        quantize=not args.no_quantize,
+        trace=not args.no_trace,
+        channels_last=not args.no_channels_last,
+        bf16=args.bf16
+    )
+    save_optimized(optimized, args.out)
+    print(f"Saved {args.out} ({serialized_size_mb(optimized):.2f} MB)")
+
+    print("Accuracy drift:", accuracy_drift(model, optimized, make_inputs(256)))
+    for name, m in [("float", model), ("optimized", optimized)]:
+        for row in benchmark(m, make_inputs):
+            print(f"{name:10s} B={row['batch_size']:4d}  {row['latency_ms']:8.2f} ms  "
+                  f"{row['samples_per_sec']:9.1f} samples/s  +{row['peak_rss_growth_mb']:.1f} MB peak RSS")
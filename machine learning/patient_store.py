@@ -0,0 +1,213 @@
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import torch
+
+
+FEATURE_COLUMNS = [
+    "body_temperature_C",
+    "pulse_bpm",
+    "blood_oxygen_percent",
+    "respiratory_rate",
+    "steps_per_hour",
+    "sleep_state",
+]
+
+N_BUCKETS = 64  # hive partitions, patients are spread by patient_id % N_BUCKETS
+
+
+def write_patients(df: pd.DataFrame, root: str, n_buckets: int = N_BUCKETS):
+    """
+    Appends patient readings to a partitioned Parquet store.
+
+    Args:
+        df        : pd.DataFrame with columns patient_id, timestamp and feature columns
+        root      : str, store directory
+        n_buckets : int, number of patient_id hash partitions
+    """
+    df = df.sort_values(["patient_id", "timestamp"], kind="stable")
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    buckets = (df["patient_id"].to_numpy() % n_buckets).astype(np.int32)
+    table = table.append_column("bucket", pa.array(buckets))
+    ds.write_dataset(
+        table,
+        root,
+        format="parquet",
+        partitioning=ds.partitioning(pa.schema([("bucket", pa.int32())]), flavor="hive"),
+        basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+        max_rows_per_group=64 * 1024,
+    )
+
+
+def write_bucket(frames, root: str, bucket: int, n_buckets: int = N_BUCKETS):
+    """
+    Streams DataFrames of patients that all belong to one bucket into a single Parquet
+    file of that partition (row groups appended frame by frame), so a bucket written by one
+    worker is one file however many chunks it was generated in.
+
+    Args:
+        frames    : iterable of pd.DataFrame (same columns as write_patients)
+        root      : str, store directory
+        bucket    : int, partition every patient_id in frames falls into
+        n_buckets : int, number of patient_id hash partitions
+
+    Returns:
+        int, number of rows written
+    """
+    path = os.path.join(root, f"bucket={bucket}", f"part-{uuid.uuid4().hex}-0.parquet")
+    writer = None
+    n_rows = 0
+    try:
+        for df in frames:
+            if (df["patient_id"].to_numpy() % n_buckets != bucket).any():
+                raise ValueError(f"Patients outside bucket {bucket}")
+            table = pa.Table.from_pandas(df.sort_values(["patient_id", "timestamp"], kind="stable"),
+                                         preserve_index=False)
+            if writer is None:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table, row_group_size=64 * 1024)
+            n_rows += table.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    return n_rows
+
+
+def convert_xlsx_to_parquet(xlsx_path: str, root: str, n_buckets: int = N_BUCKETS):
+    """
+    One-shot conversion of the per-sheet Excel file (one sheet per patient, the sheet
+    name being the patient id) into the Parquet patient store.
+    """
+    sheets = pd.read_excel(xlsx_path, sheet_name=None, engine="openpyxl")
+    frames = []
+    for sheet_name, df in sheets.items():
+        df = df.copy()
+        df.insert(0, "patient_id", np.int64(sheet_name))
+        df["timestamp"] = pd.to_datetime(df["timestamp"])
+        frames.append(df)
+    write_patients(pd.concat(frames, ignore_index=True), root, n_buckets)
+
+
+class PatientStore:
+    """
+    Lazy reader over the partitioned Parquet patient store.
+
+    Only the requested patients, columns and time range are read from disk: the bucket
+    partition prunes files and the patient_id/timestamp filters are pushed down to the
+    Parquet row-group statistics.
+    """
+
+    def __init__(self, root: str, n_buckets: int = N_BUCKETS):
+        if not os.path.isdir(root):
+            raise FileNotFoundError(f"No patient store at {root}")
+        self.root = root
+        self.n_buckets = n_buckets
+        self.dataset = ds.dataset(root, format="parquet", partitioning="hive")
+
+    def bucket_patient_ids(self, bucket: int) -> np.ndarray:
+        """
+        Sorted patient ids of one bucket, scanned record batch by record batch so only
+        that partition's patient_id column is touched (never the whole store).
+        """
+        ids = [
+            pc.unique(batch["patient_id"]).to_numpy()
+            for batch in self.dataset.to_batches(columns=["patient_id"], filter=ds.field("bucket") == bucket)
+        ]
+        return np.unique(np.concatenate(ids)) if ids else np.empty(0, dtype=np.int64)
+
+    def patient_ids(self) -> np.ndarray:
+        return np.sort(np.concatenate([self.bucket_patient_ids(b) for b in range(self.n_buckets)]))
+
+    def _filter(self, patient_ids=None, start=None, end=None):
+        expr = None
+
+        def both(a, b):
+            return b if a is None else a & b
+
+        if patient_ids is not None:
+            patient_ids = [int(p) for p in patient_ids]
+            buckets = sorted({p % self.n_buckets for p in patient_ids})
+            expr = both(expr, ds.field("bucket").isin(buckets))
+            expr = both(expr, ds.field("patient_id").isin(patient_ids))
+        if start is not None:
+            expr = both(expr, ds.field("timestamp") >= pd.Timestamp(start))
+        if end is not None:
+            expr = both(expr, ds.field("timestamp") < pd.Timestamp(end))
+        return expr
+
+    def read(self, patient_ids=None, columns=None, start=None, end=None) -> pd.DataFrame:
+        """
+        Reads selected patients / columns / time range [start, end) as a DataFrame
+        sorted by patient_id and timestamp.
+        """
+        columns = ["patient_id", "timestamp"] + list(columns or FEATURE_COLUMNS)
+        table = self.dataset.to_table(columns=columns, filter=self._filter(patient_ids, start, end))
+        return table.to_pandas().sort_values(["patient_id", "timestamp"], kind="stable", ignore_index=True)
+
+    def iter_batches(self, patient_ids=None, batch_size=256, columns=None, start=None, end=None):
+        """
+        Streams the store as padded [B, T, F] batches, B patients at a time.
+
+        Patients are taken bucket by bucket (sorted by id within a bucket) and the ids
+        left over at the end of a bucket are carried into the next one, so every batch but
+        the last has batch_size patients. A batch that fits in one bucket reads only that
+        partition, and the ids of only one bucket are held at a time.
+
+        Yields:
+            ids     : np.ndarray [B] patient ids of the batch
+            tensor  : torch.Tensor [B, T_max, F], padded with NaN after each series
+            lengths : torch.Tensor [B] number of readings per patient
+        """
+        columns = list(columns or FEATURE_COLUMNS)
+        if patient_ids is not None:
+            patient_ids = np.asarray(patient_ids, dtype=np.int64)
+
+        pending = np.empty(0, dtype=np.int64)
+        for bucket in range(self.n_buckets):
+            if patient_ids is None:
+                ids = self.bucket_patient_ids(bucket)
+            else:
+                ids = np.sort(patient_ids[patient_ids % self.n_buckets == bucket])
+            pending = np.concatenate([pending, ids])
+            while len(pending) >= batch_size:
+                df = self.read(pending[:batch_size], columns, start, end)
+                pending = pending[batch_size:]
+                yield to_padded_tensor(df, columns)
+        if len(pending):
+            yield to_padded_tensor(self.read(pending, columns, start, end), columns)
+
+
+def to_padded_tensor(df: pd.DataFrame, columns: list):
+    """
+    Pivots long-format readings (sorted by patient_id, timestamp) into a NaN-padded
+    [B, T_max, F] tensor without a per-patient loop.
+    """
+    ids, first, lengths = np.unique(df["patient_id"].to_numpy(), return_index=True, return_counts=True)
+    values = df[columns].to_numpy(dtype=np.float32)
+
+    rows = np.repeat(np.arange(len(ids)), lengths)
+    steps = np.arange(len(df)) - np.repeat(first, lengths)
+    out = np.full((len(ids), lengths.max() if len(ids) else 0, len(columns)), np.nan, dtype=np.float32)
+    out[rows, steps] = values
+    return ids, torch.from_numpy(out), torch.from_numpy(lengths)
+
+
+if __name__ == "__main__":
+    import time
+
+    convert_xlsx_to_parquet("synthetic_patients_data.xlsx", "patient_store")
+    store = PatientStore("patient_store")
+    print("Patients:", store.patient_ids())
+
+    start = time.perf_counter()
+    for ids, batch, lengths in store.iter_batches(batch_size=2, start="2025-01-02", end="2025-01-05"):
+        print(ids, batch.shape, lengths.tolist())
+    print(f"Loaded in {(time.perf_counter() - start) * 1e3:.1f} ms")
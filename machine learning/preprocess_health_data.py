@@ -1,8 +1,9 @@
 import numpy as np
 import torch
 import pandas as pd
-import matplotlib.pyplot as plt
+from instrumentation import traced
 
+@traced()
 def preprocess_health_data(raw_tensor: torch.Tensor, outlier_z=3.0) -> torch.Tensor:
     """
     Cleans health data: handles missing values (NaNs), removes outliers, normalizes per user.
@@ -38,6 +39,81 @@ def preprocess_health_data(raw_tensor: torch.Tensor, outlier_z=3.0) -> torch.Ten
 
     return torch.tensor(np.stack(processed), dtype=torch.float32)
 
+
+def _interpolate_nan_linear(x: np.ndarray) -> np.ndarray:
+    """
+    NaN-aware linear interpolation along T of a [B, T, F] array.
+
+    Matches pandas interpolate(method="linear", limit_direction="both"): gaps are filled
+    linearly between neighbours, leading/trailing NaNs take the nearest valid value and
+    all-NaN series stay NaN.
+    """
+    B, T, F = x.shape
+    valid = ~np.isnan(x)
+    idx = np.arange(T).reshape(1, T, 1)
+
+    # Index of the previous / next valid sample for every position
+    prev = np.maximum.accumulate(np.where(valid, idx, -1), axis=1)
+    nxt = np.minimum.accumulate(np.where(valid, idx, T)[:, ::-1], axis=1)[:, ::-1]
+    has_prev = prev >= 0
+    has_next = nxt < T
+
+    x_prev = np.take_along_axis(x, np.clip(prev, 0, T - 1), axis=1)
+    x_next = np.take_along_axis(x, np.clip(nxt, 0, T - 1), axis=1)
+
+    both = has_prev & has_next
+    span = np.where(both, nxt - prev, 1)
+    weight = np.where(both & (span > 0), (idx - prev) / np.maximum(span, 1), 0.0)
+    interpolated = x_prev + weight * (x_next - x_prev)
+    return np.where(both, interpolated, np.where(has_prev, x_prev, x_next))
+
+
+def _nan_mean_std(x: np.ndarray):
+    """
+    Per-series mean and sample std (ddof=1) over T, skipping NaNs like pandas does.
+    """
+    valid = ~np.isnan(x)
+    count = valid.sum(axis=1, keepdims=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = np.where(valid, x, 0.0).sum(axis=1, keepdims=True) / count
+        sq = np.where(valid, (x - mean) ** 2, 0.0).sum(axis=1, keepdims=True)
+        std = np.sqrt(sq / (count - 1))
+    return mean, std
+
+
+@traced()
+def preprocess_health_data_batched(raw_tensor: torch.Tensor, outlier_z=3.0) -> torch.Tensor:
+    """
+    Vectorized equivalent of preprocess_health_data working on the whole batch at once.
+
+    Args:
+        raw_tensor: [B, T, F] – raw health data (may contain NaNs)
+        outlier_z: float – z-score threshold for outlier removal (default: 3.0)
+
+    Returns:
+        torch.Tensor of shape [B, T, F] – cleaned and normalized
+    """
+    x = np.asarray(raw_tensor, dtype=np.float64)
+
+    # 1. Missing value imputation
+    x = _interpolate_nan_linear(x)
+
+    # 2. Outlier removal (z-score)
+    mean, std = _nan_mean_std(x)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        outliers = np.abs((x - mean) / std) > outlier_z
+    x[outliers] = np.nan
+
+    # 3. Impute again after outlier removal
+    x = _interpolate_nan_linear(x)
+
+    # 4. Per-user (per-batch) normalization
+    mean, std = _nan_mean_std(x)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        normed = (x - mean) / std
+
+    return torch.from_numpy(normed.astype(np.float32))
+
 def downsample_health_to_satellite_times(
     health_df: pd.DataFrame,
     satellite_times: list,
@@ -76,7 +152,191 @@ def downsample_health_to_satellite_times(
     return result
 
 
+def flatten_patient_frames(health_dfs: list):
+    """
+    Flattens per-patient DataFrames (datetime index, same feature columns) into the
+    flat arrays consumed by align_cohort_to_satellite_times.
+
+    Returns:
+        patient_index [N], timestamps [N] (datetime64[ns]), values [N, F]
+    """
+    patient_index = np.concatenate([np.full(len(df), b, dtype=np.int64) for b, df in enumerate(health_dfs)])
+    timestamps = np.concatenate([pd.DatetimeIndex(df.index).as_unit("ns").to_numpy() for df in health_dfs])
+    values = np.concatenate([df.to_numpy(dtype=np.float64) for df in health_dfs])
+    return patient_index, timestamps, values
+
+
+def align_cohort_to_satellite_times(
+    patient_index,
+    timestamps,
+    values,
+    satellite_times: list,
+    window: str = "12h",
+    n_patients: int = None,
+    fill_value: float = 0.0
+):
+    """
+    Aligns a whole cohort's health readings to satellite timestamps in one vectorized pass.
+
+    Readings are sorted once by (patient, time); every window [t - w/2, t + w/2] is then
+    located with searchsorted and averaged from cumulative sums, so the cost is
+    O(N log N + B * T log N) with no per-timestamp slicing. Unlike
+    downsample_health_to_satellite_times, empty windows are kept (filled with fill_value)
+    and flagged in the mask, so T is the same for every patient.
+
+    Args:
+        patient_index   : [N] int array, patient of each reading (0 .. B-1)
+        timestamps      : [N] datetime-like array, time of each reading
+        values          : [N, F] float array, health features (NaNs are skipped)
+        satellite_times : list of str or pd.Timestamp, satellite image timestamps
+        window          : str, aggregation window (e.g. '12h' means ±6h around each timestamp)
+        n_patients      : int, B (defaults to max(patient_index) + 1)
+        fill_value      : float, value used for windows without any reading
+
+    Returns:
+        torch.Tensor [B, T, F] – window means
+        torch.Tensor [B, T]    – bool mask, True where the window contained readings
+    """
+    patient_index = np.asarray(patient_index, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    F = values.shape[1] if values.ndim > 1 else 1
+    values = values.reshape(len(patient_index), F)
+    t = pd.DatetimeIndex(timestamps).as_unit("ns").asi8
+    # Converted one by one like downsample_health_to_satellite_times, so mixed formats work
+    q = pd.DatetimeIndex([pd.to_datetime(x) for x in satellite_times]).as_unit("ns").asi8
+    half = pd.Timedelta(window).value // 2
+    B = n_patients if n_patients is not None else (int(patient_index.max()) + 1 if len(patient_index) else 0)
+
+    if len(t) == 0 or len(q) == 0:  # no readings or no timestamps: every window is empty
+        means = torch.full((B, len(q), F), fill_value, dtype=torch.float32)
+        return means, torch.zeros(B, len(q), dtype=torch.bool)
+
+    # Composite (patient, time) key; coarsen ns -> us -> ms -> s until it fits in int64
+    base = int(min(t.min(), q.min() - half))
+    top = int(max(t.max(), q.max() + half))
+    unit = 1
+    while B * ((top - base) // unit + 1) >= 2 ** 62:
+        unit *= 1000
+    span = (top - base) // unit + 1
+
+    key = patient_index * span + (t - base) // unit
+    order = np.argsort(key, kind="stable")
+    key = key[order]
+    values = values[order]
+
+    # Prefix sums of values and of non-NaN counts, per feature
+    valid = ~np.isnan(values)
+    cum_sum = np.zeros((len(key) + 1, F))
+    cum_cnt = np.zeros((len(key) + 1, F), dtype=np.int64)
+    np.cumsum(np.where(valid, values, 0.0), axis=0, out=cum_sum[1:])
+    np.cumsum(valid, axis=0, out=cum_cnt[1:])
+
+    offsets = np.arange(B, dtype=np.int64)[:, None] * span
+    lo = np.searchsorted(key, offsets + (q - half - base) // unit, side="left")   # [B, T]
+    hi = np.searchsorted(key, offsets + (q + half - base) // unit, side="right")  # [B, T]
+
+    sums = cum_sum[hi] - cum_sum[lo]  # [B, T, F]
+    counts = cum_cnt[hi] - cum_cnt[lo]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        means = sums / counts
+
+    mask = hi > lo
+    means[~mask] = fill_value
+
+    return torch.from_numpy(means.astype(np.float32)), torch.from_numpy(mask)
+
+
+class OnlineHealthPreprocessor:
+    """
+    Incremental counterpart of preprocess_health_data for live readings.
+
+    Keeps a constant-size state per patient and feature: reading count, running mean and
+    sum of squared deviations (Welford), the last accepted value and the number of
+    consecutive outliers. Each new reading is checked against the running z-score
+    (outliers are rejected once min_count readings were seen), gaps are filled causally
+    with the last accepted value, and the value is emitted normalized with the running
+    statistics. After max_rejections consecutive outliers the readings are admitted
+    again, so a real level shift (e.g. a fever) enters the statistics instead of being
+    filtered out forever.
+    """
+
+    def __init__(self, outlier_z=3.0, min_count=10, max_rejections=5, eps=1e-6):
+        self.outlier_z = outlier_z
+        self.min_count = min_count
+        self.max_rejections = max_rejections
+        self.eps = eps
+        self.states = {}  # patient_id -> [5, F] tensor of (n, mean, m2, last, outlier run)
+
+    def _new_state(self, n_features):
+        state = torch.zeros(5, n_features, dtype=torch.float64)
+        state[3] = float("nan")
+        return state
+
+    def update(self, patient_ids: list, readings) -> torch.Tensor:
+        """
+        Consumes one reading per patient and returns it cleaned and normalized.
+
+        Args:
+            patient_ids: list of hashable patient ids (length B, no duplicates)
+            readings:    [B, F] raw health readings (NaN = missing)
+
+        Returns:
+            torch.Tensor of shape [B, F] – normalized readings (0 until a feature has
+            at least two accepted readings)
+        """
+        x = torch.as_tensor(readings, dtype=torch.float64)
+        state = torch.stack([self.states[pid] if pid in self.states else self._new_state(x.size(1))
+                             for pid in patient_ids])
+        n, mean, m2, last, run = state.unbind(dim=1)
+
+        # 1. Online outlier detection against the statistics seen so far; a run longer
+        #    than max_rejections is a level shift and is admitted
+        observed = ~torch.isnan(x)
+        std = torch.sqrt(m2 / (n - 1).clamp(min=1))
+        z = (x - mean) / (std + self.eps)
+        outlier = observed & (n >= self.min_count) & (z.abs() > self.outlier_z)
+        run = torch.where(outlier, run + 1, torch.where(observed, torch.zeros_like(run), run))
+        accepted = observed & ~(outlier & (run <= self.max_rejections))
+
+        # 2. Welford update with accepted readings only
+        n = n + accepted.double()
+        delta = torch.where(accepted, x - mean, torch.zeros_like(x))
+        mean = mean + delta / n.clamp(min=1)
+        m2 = m2 + torch.where(accepted, delta * (x - mean), torch.zeros_like(x))
+
+        # 3. Causal gap filling: carry the last accepted value (running mean before any)
+        last = torch.where(accepted, x, last)
+        filled = torch.where(torch.isnan(last), mean, last)
+
+        # 4. Normalization with the running statistics
+        std = torch.sqrt(m2 / (n - 1).clamp(min=1))
+        normed = torch.where(n > 1, (filled - mean) / (std + self.eps), torch.zeros_like(filled))
+
+        new_state = torch.stack([n, mean, m2, last, run], dim=1)
+        for i, pid in enumerate(patient_ids):
+            self.states[pid] = new_state[i].clone()  # own storage, not a view of the batch
+        return normed.float()
+
+    def reset(self, patient_id):
+        self.states.pop(patient_id, None)
+
+    def state_dict(self) -> dict:
+        return dict(self.states)
+
+    def load_state_dict(self, states: dict):
+        # States saved before the outlier run counter existed have 4 rows
+        self.states = {pid: torch.cat([s, torch.zeros_like(s[:1])]) if s.size(0) == 4 else s
+                       for pid, s in states.items()}
+
+    def save(self, path):
+        torch.save(self.state_dict(), path)
+
+    def load(self, path):
+        self.load_state_dict(torch.load(path))
+
+
 if __name__ == "__main__":
+    import matplotlib.pyplot as plt
 
     def visualize_health_preprocessing(raw: torch.Tensor, cleaned: torch.Tensor, feature_names=None):
         """
@@ -150,4 +410,19 @@ if __name__ == "__main__":
     )
 
     print("Downsampled health tensor shape:", health_tensor.shape)  # [1, T, F]
-    print(health_tensor)
\ No newline at end of file
+    print(health_tensor)
+
+    # Cohort aligner: same window means as the per-patient path, fixed T with a mask
+    patient_index, timestamps, values = flatten_patient_frames([cleaned_df, cleaned_df.iloc[::2]])
+    cohort_tensor, cohort_mask = align_cohort_to_satellite_times(
+        patient_index, timestamps, values,
+        ["2024-08-05", "2024-08-10", "2024-08-15", "2024-09-30"],
+        window="12h"
+    )
+    print("Cohort tensor shape:", cohort_tensor.shape, "mask:", cohort_mask.tolist())  # [2, 4, F]
+    assert torch.allclose(cohort_tensor[0, :3], health_tensor[0], atol=1e-5)
+
+    # Online preprocessor: feed the demo series one reading at a time
+    online = OnlineHealthPreprocessor(outlier_z=3.0)
+    streamed = torch.stack([online.update(["demo"], row[None]) for row in torch.tensor(health_df.to_numpy())], dim=1)
+    print("Streamed health tensor shape:", streamed.shape)  # [1, T, F]
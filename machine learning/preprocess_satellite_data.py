@@ -1,12 +1,15 @@
 import torch
-from hystorical_sentinel import get_sentinel_image_tensor
-import matplotlib.pyplot as plt
 import numpy as np
+from instrumentation import traced
 
+@traced()
 def preprocess_satellite_data(
     tensor: torch.Tensor,
     selected_channels: list = None,
-    norm_type: str = "zscore"
+    norm_type: str = "zscore",
+    inplace: bool = False,
+    stats=None,
+    season: str = None
 ) -> torch.Tensor:
     """
     Applies channel selection and normalization to satellite data.
@@ -15,27 +18,60 @@ def preprocess_satellite_data(
         tensor: [B, C, T, H, W] input satellite tensor
         selected_channels: list of channel indices to keep (optional)
         norm_type: "zscore" or "minmax"
+        inplace: normalize the (floating point) input buffer in place instead of
+                 allocating a new tensor; a contiguous channel range stays a view
+        stats: precomputed BandStatistics of the reference archive (all C input bands);
+               normalization is then a single fused raw * scale + shift pass and is
+               identical across regions and runs
+        season: optional season key selecting per-season statistics
 
     Returns:
         torch.Tensor [B, C', T, H, W] processed satellite tensor
     """
     B, C, T, H, W = tensor.shape
 
-    # 1. Channel selection
+    # 1. Channel selection (a contiguous ascending range is sliced as a view, no copy)
     if selected_channels is not None:
-        tensor = tensor[:, selected_channels, :, :, :]
-        C = len(selected_channels)
-
-    # 2. Normalization
+        channels = list(selected_channels)
+        if channels == list(range(channels[0], channels[0] + len(channels))):
+            tensor = tensor[:, channels[0]:channels[0] + len(channels)]
+        else:
+            tensor = tensor[:, channels, :, :, :]
+        C = len(channels)
+
+    # 2a. Precomputed statistics: one fused multiply-add pass, no per-sample reductions
+    if stats is not None:
+        scale, shift = stats.scale_shift(norm_type, season)
+        if selected_channels is not None:
+            scale, shift = scale[channels], shift[channels]
+        scale = torch.as_tensor(scale, dtype=torch.float32).view(1, C, 1, 1, 1)
+        shift = torch.as_tensor(shift, dtype=torch.float32).view(1, C, 1, 1, 1)
+        if inplace:
+            if not tensor.is_floating_point():
+                raise ValueError(f"In-place normalization needs a floating point tensor, got {tensor.dtype}")
+            return torch.addcmul(shift.to(tensor.dtype), tensor, scale.to(tensor.dtype), out=tensor)
+        return torch.addcmul(shift, tensor, scale)
+
+    if not inplace:
+        tensor = tensor.float()
+    elif not tensor.is_floating_point():
+        raise ValueError(f"In-place normalization needs a floating point tensor, got {tensor.dtype}")
+
+    # 2b. Normalization with statistics of this sample
     if norm_type == "zscore":
-        mean = tensor.mean(dim=(2, 3, 4), keepdim=True)
-        std = tensor.std(dim=(2, 3, 4), keepdim=True)
-        tensor = (tensor - mean) / (std + 1e-6)
+        std, mean = torch.std_mean(tensor, dim=(2, 3, 4), keepdim=True)
+        if inplace:
+            tensor.sub_(mean).div_(std + 1e-6)
+        else:
+            tensor = (tensor - mean) / (std + 1e-6)
 
     elif norm_type == "minmax":
         min_val = tensor.amin(dim=(2, 3, 4), keepdim=True)
         max_val = tensor.amax(dim=(2, 3, 4), keepdim=True)
-        tensor = (tensor - min_val) / (max_val - min_val + 1e-6)
+        if inplace:
+            tensor.sub_(min_val).div_(max_val - min_val + 1e-6)
+        else:
+            tensor = (tensor - min_val) / (max_val - min_val + 1e-6)
 
     else:
         raise ValueError(f"Unknown norm_type: {norm_type}")
@@ -44,6 +80,8 @@ def preprocess_satellite_data(
 
 
 if __name__ == "__main__":
+    import matplotlib.pyplot as plt
+    from hystorical_satellite_fetcher import get_sentinel_image_tensor
 
     def visualize_satellite_preprocessing(raw: torch.Tensor, processed: torch.Tensor, channel_names=None):
         """
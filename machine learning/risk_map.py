@@ -0,0 +1,231 @@
+import json
+import math
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+import torch
+from sentinelhub.exceptions import DownloadFailedException
+
+from hystorical_satellite_fetcher import get_sentinel_image_tensor
+from preprocess_satellite_data import preprocess_satellite_data
+
+
+def split_aoi_into_cells(aoi, cell_size_deg=0.1):
+    """
+    Splits an AOI into cells of a global lon/lat grid.
+
+    Cells are snapped to multiples of cell_size_deg, so the same cell always gets the
+    same id and bbox whatever AOI it was requested from (and fetches can be deduplicated
+    and cached across runs).
+
+    Args:
+        aoi           : list [min_lon, min_lat, max_lon, max_lat]
+        cell_size_deg : float, cell side in degrees
+
+    Returns:
+        list of dicts {"id", "row", "col", "bbox"} ordered north to south, west to east
+    """
+    min_lon, min_lat, max_lon, max_lat = aoi
+    eps = 1e-9  # keeps AOI edges that fall on grid lines (e.g. 60.1 / 0.1) from adding a cell
+    col0, col1 = math.floor(min_lon / cell_size_deg + eps), math.ceil(max_lon / cell_size_deg - eps)
+    row0, row1 = math.floor(min_lat / cell_size_deg + eps), math.ceil(max_lat / cell_size_deg - eps)
+
+    cells = []
+    for row in range(row1 - 1, row0 - 1, -1):
+        for col in range(col0, col1):
+            cells.append({
+                "id": f"r{row}_c{col}",
+                "row": row,
+                "col": col,
+                "bbox": [round(col * cell_size_deg, 6), round(row * cell_size_deg, 6),
+                         round((col + 1) * cell_size_deg, 6), round((row + 1) * cell_size_deg, 6)],
+            })
+    return cells
+
+
+def score_aoi(
+    model,
+    aoi,
+    time_start,
+    time_end,
+    cell_size_deg=0.1,
+    health_by_cell=None,
+    n_images=5,
+    bands=("B03", "B11", "B12"),
+    max_dim=128,
+    cache=None,
+    stats=None,
+    config=None,
+    fetch_workers=8,
+    encode_batch_size=32,
+    risk_class=1,
+    tile_size=None
+):
+    """
+    Scores an outbreak risk map over a grid of cells covering the AOI.
+
+    Cells are fetched on a thread pool in waves of max(fetch_workers, encode_batch_size);
+    finished cells are buffered per [C, T, H, W] shape and encoded by Satellite3DEncoder
+    as soon as encode_batch_size of them are waiting, so only about one wave of rasters
+    is held in memory whatever the AOI size. Every cell is then scored against its
+    patients' health series.
+
+    Args:
+        model             : HybridFusionModel (put in eval mode by the caller)
+        aoi               : list [min_lon, min_lat, max_lon, max_lat]
+        time_start/end    : str, satellite date range
+        cell_size_deg     : float, grid cell side in degrees
+        health_by_cell    : dict cell id -> preprocessed [N, T, F] health tensor; cells
+                            without patients are scored with a neutral (all-zero, i.e.
+                            population-mean) series
+        n_images, bands   : passed to get_sentinel_image_tensor
+        max_dim           : max cell raster side in pixels
+        cache             : SceneCache shared by all cell fetches
+        stats             : BandStatistics for consistent normalization across cells
+        config            : SHConfig shared by all fetches
+        fetch_workers     : concurrent cell fetches
+        encode_batch_size : cells per Satellite3DEncoder forward pass
+        risk_class        : index of the outbreak class in the classifier output
+        tile_size         : use Satellite3DEncoder.forward_tiled for large cells
+
+    Returns:
+        list of dicts {"id", "row", "col", "bbox", "risk", "n_patients", "error"}; risk is
+        None for cells without usable imagery or whose download failed (error says why)
+    """
+    if config is None:
+        from cdse_config import get_config
+        config = get_config()
+    health_by_cell = health_by_cell or {}
+    cells = split_aoi_into_cells(aoi, cell_size_deg)
+
+    def fetch(cell):
+        raw = get_sentinel_image_tensor(
+            cell["bbox"], time_start, time_end, n_images=n_images, bands=bands,
+            max_dim=max_dim, config=config, visualize=False, cache=cache, max_workers=1
+        )
+        return preprocess_satellite_data(raw, norm_type="zscore", inplace=True, stats=stats)
+
+    embeddings = {}
+    errors = {}
+    by_shape = defaultdict(list)  # [C, T, H, W] -> [(cell index, tensor)] waiting to be encoded
+
+    def encode(shape):
+        chunk, by_shape[shape] = by_shape[shape], []
+        batch = torch.cat([tensor for _, tensor in chunk])
+        if tile_size is not None:
+            s_embed = model.sat_encoder.forward_tiled(batch, tile_size)
+        else:
+            s_embed = model.sat_encoder(batch)
+        for (i, _), e in zip(chunk, s_embed):
+            embeddings[i] = e.unsqueeze(0)
+
+    wave_size = max(fetch_workers, encode_batch_size)
+    with ThreadPoolExecutor(max_workers=fetch_workers) as executor, torch.inference_mode():
+        for wave in range(0, len(cells), wave_size):
+            futures = {executor.submit(fetch, cells[i]): i for i in range(wave, min(wave + wave_size, len(cells)))}
+            for future in as_completed(futures):
+                i = futures.pop(future)
+                try:
+                    tensor = future.result()
+                except ValueError:  # no cloud-free scenes for this cell
+                    errors[i] = "no cloud-free scenes"
+                    continue
+                except DownloadFailedException as e:  # one failed cell must not abort the map
+                    errors[i] = f"download failed: {e}"
+                    continue
+                shape = tuple(tensor.shape[1:])
+                by_shape[shape].append((i, tensor))
+                if len(by_shape[shape]) >= encode_batch_size:
+                    encode(shape)
+        for shape in list(by_shape):
+            if by_shape[shape]:
+                encode(shape)
+
+    with torch.inference_mode():
+        health_dim = model.health_encoder.gru.input_size
+        results = []
+        for i, cell in enumerate(cells):
+            health = health_by_cell.get(cell["id"])
+            n_patients = 0 if health is None else health.size(0)
+            risk = None
+            if i in embeddings:
+                if health is None:
+                    health = torch.zeros(1, 1, health_dim)
+                probs = torch.softmax(model.forward_with_sat_embedding(health, embeddings[i]), dim=1)
+                risk = probs[:, risk_class].mean().item()
+            results.append({**cell, "risk": risk, "n_patients": n_patients, "error": errors.get(i)})
+    return results
+
+
+def risk_map_to_geojson(results, path=None):
+    """
+    Converts scored cells to a GeoJSON FeatureCollection of cell polygons.
+
+    Each feature carries "risk" (0-1) and "intensity" (0-10, the property the HealthMap
+    heatmap layer reads). Writes the file when a path is given.
+    """
+    features = []
+    for r in results:
+        if r["risk"] is None:
+            continue
+        min_lon, min_lat, max_lon, max_lat = r["bbox"]
+        features.append({
+            "type": "Feature",
+            "geometry": {
+                "type": "Polygon",
+                "coordinates": [[[min_lon, min_lat], [max_lon, min_lat], [max_lon, max_lat],
+                                 [min_lon, max_lat], [min_lon, min_lat]]],
+            },
+            "properties": {
+                "id": r["id"],
+                "risk": round(r["risk"], 4),
+                "intensity": round(r["risk"] * 10, 2),
+                "n_patients": r["n_patients"],
+            },
+        })
+    collection = {"type": "FeatureCollection", "features": features}
+    if path is not None:
+        with open(path, "w") as f:
+            json.dump(collection, f)
+    return collection
+
+
+def risk_map_to_raster(results):
+    """
+    Converts scored cells to a [rows, cols] risk raster (north-up, NaN = no data).
+
+    Returns:
+        np.ndarray raster, bounds [min_lon, min_lat, max_lon, max_lat]
+    """
+    rows = [r["row"] for r in results]
+    cols = [r["col"] for r in results]
+    raster = np.full((max(rows) - min(rows) + 1, max(cols) - min(cols) + 1), np.nan, dtype=np.float32)
+    for r in results:
+        if r["risk"] is not None:
+            raster[max(rows) - r["row"], r["col"] - min(cols)] = r["risk"]
+
+    bounds = [
+        min(r["bbox"][0] for r in results), min(r["bbox"][1] for r in results),
+        max(r["bbox"][2] for r in results), max(r["bbox"][3] for r in results),
+    ]
+    return raster, bounds
+
+
+if __name__ == "__main__":
+    from hybrid_fusion_pipeline import HybridFusionModel
+    from scene_cache import SceneCache
+
+    model = HybridFusionModel(health_input_dim=3, sat_input_channels=3, embed_dim=16, num_classes=2).eval()
+    results = score_aoi(
+        model,
+        aoi=[24.50, 60.10, 25.30, 60.40],  # Greater Helsinki
+        time_start="2024-08-01",
+        time_end="2024-10-01",
+        cell_size_deg=0.1,
+        cache=SceneCache()
+    )
+    risk_map_to_geojson(results, "risk_map.geojson")
+    raster, bounds = risk_map_to_raster(results)
+    np.save("risk_map.npy", raster)
+    print(f"Scored {sum(r['risk'] is not None for r in results)}/{len(results)} cells, raster {raster.shape}")
@@ -0,0 +1,149 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "healthradar", "scenes")
+
+
+def make_scene_key(bbox_coords, date, bands, evalscript, resolution, size):
+    """
+    Builds a content-addressed key for a single downloaded scene.
+
+    Args:
+        bbox_coords : list   [min_lon, min_lat, max_lon, max_lat]
+        date        : str    acquisition date, e.g. "2024-08-05"
+        bands       : tuple  band names requested from the evalscript
+        evalscript  : str    evalscript sent to the process API
+        resolution  : int    resolution in meters
+        size        : tuple  (width, height) in pixels
+
+    Returns:
+        str – hex sha256 digest identifying the scene
+    """
+    payload = json.dumps({
+        "bbox": [round(float(c), 6) for c in bbox_coords],
+        "date": str(date),
+        "bands": list(bands),
+        "evalscript": evalscript.strip(),
+        "resolution": resolution,
+        "size": list(size),
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SceneCache:
+    """
+    Persistent on-disk cache of downloaded scenes with a byte budget and LRU eviction.
+
+    Every scene is stored as a single .npy file named after its key. Hits are returned
+    memory-mapped (read-only), so a repeat run never copies the raster into RAM until
+    it is actually used. Recency is kept in the file mtime, which makes the LRU order
+    survive restarts and be shared between processes using the same directory: scenes
+    written by another process are adopted on lookup, and eviction rescans the directory
+    so the byte budget holds for all of them.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=2 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # key -> size in bytes, oldest first
+        self._entries = OrderedDict()
+        self._scan()
+
+    def _scan(self):
+        # Rebuilds the LRU order from the directory (includes other processes' files)
+        files = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".npy"):
+                try:
+                    stat = os.stat(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:  # evicted by another process meanwhile
+                    continue
+                files.append((stat.st_mtime, name[:-4], stat.st_size))
+        self._entries = OrderedDict((key, nbytes) for _, key, nbytes in sorted(files))
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npy")
+
+    @property
+    def total_bytes(self):
+        return sum(self._entries.values())
+
+    def get(self, key):
+        """
+        Returns the cached scene as a read-only memory-mapped array, or None on a miss.
+        """
+        path = self._path(key)
+        try:
+            os.utime(path)
+            array = np.load(path, mmap_mode="r")
+        except FileNotFoundError:  # never cached, or evicted (possibly by another process)
+            with self._lock:
+                self._entries.pop(key, None)
+                self.misses += 1
+            return None
+        with self._lock:
+            # Adopts scenes another process cached after this one started
+            self._entries.setdefault(key, array.nbytes)
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return array
+
+    def put(self, key, array):
+        """
+        Stores a scene and evicts least recently used entries until the budget fits.
+        """
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, np.ascontiguousarray(array))
+        os.replace(tmp_path, path)  # atomic, readers never see partial files
+
+        with self._lock:
+            self._entries[key] = os.path.getsize(path)
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def _evict(self):
+        self._scan()
+        total = self.total_bytes
+        while total > self.max_bytes and len(self._entries) > 1:
+            key, nbytes = self._entries.popitem(last=False)
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+            total -= nbytes
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                try:
+                    os.remove(self._path(key))
+                except FileNotFoundError:
+                    pass
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Returns hit/miss counters and current usage of the cache.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+        }
@@ -0,0 +1,186 @@
+import datetime as dt
+import json
+import os
+import sqlite3
+import threading
+
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.expanduser("~"), ".cache", "healthradar", "scene_index.sqlite")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS scenes (
+    collection  TEXT NOT NULL,
+    region      TEXT NOT NULL,
+    scene_id    TEXT NOT NULL,
+    date        TEXT NOT NULL,
+    datetime    TEXT,
+    cloud_cover REAL,
+    platform    TEXT,
+    properties  TEXT,
+    PRIMARY KEY (collection, region, scene_id)
+);
+CREATE INDEX IF NOT EXISTS scenes_by_date ON scenes (collection, region, date);
+CREATE TABLE IF NOT EXISTS coverage (
+    collection TEXT NOT NULL,
+    region     TEXT NOT NULL,
+    start      TEXT NOT NULL,
+    end        TEXT NOT NULL,
+    PRIMARY KEY (collection, region)
+);
+"""
+
+
+def region_key(bbox_coords) -> str:
+    """
+    Stable key of a bbox (rounded to 1e-6 degrees, as in make_scene_key).
+    """
+    return ",".join(f"{float(c):.6f}" for c in bbox_coords)
+
+
+def _collection_key(data_collection) -> str:
+    return getattr(data_collection, "api_id", None) or str(data_collection)
+
+
+def _shift_date(date, days):
+    return (dt.date.fromisoformat(date) + dt.timedelta(days=days)).isoformat()
+
+
+class SceneIndex:
+    """
+    Persistent SQLite index of catalog scenes per (collection, region).
+
+    Every scene returned by the catalog is stored with its acquisition date, cloud cover
+    and STAC properties, together with the date range already searched for the region.
+    sync() only searches the parts of a requested range that are not covered yet, so a
+    daily job issues one small catalog query per region, and select_dates() picks the
+    scenes locally (cloud filtering included, so changing max_cloud needs no new query).
+    """
+
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        self.path = path
+        self.catalog_queries = 0
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")  # readers in other processes don't block writers
+            conn.executescript(_SCHEMA)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def coverage(self, data_collection, bbox_coords):
+        """
+        Returns the (start, end) date range already searched for a region, or None.
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT start, end FROM coverage WHERE collection = ? AND region = ?",
+                (_collection_key(data_collection), region_key(bbox_coords))
+            ).fetchone()
+        return tuple(row) if row else None
+
+    def add_scenes(self, data_collection, bbox_coords, features):
+        """
+        Upserts catalog features (STAC items) of a region.
+        """
+        rows = []
+        for feature in features:
+            properties = feature.get("properties", {})
+            rows.append((
+                _collection_key(data_collection),
+                region_key(bbox_coords),
+                feature["id"],
+                properties["datetime"][:10],
+                properties["datetime"],
+                properties.get("eo:cloud_cover"),
+                properties.get("platform"),
+                json.dumps(properties),
+            ))
+        with self._lock, self._connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO scenes VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def _mark_covered(self, data_collection, bbox_coords, start, end):
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO coverage VALUES (?, ?, ?, ?)",
+                (_collection_key(data_collection), region_key(bbox_coords), start, end)
+            )
+
+    def sync(self, catalog, data_collection, bbox, bbox_coords, time_start, time_end, refresh_days=1):
+        """
+        Searches the catalog for the parts of [time_start, time_end] not indexed yet.
+
+        Args:
+            catalog         : SentinelHubCatalog
+            data_collection : DataCollection searched
+            bbox            : sentinelhub BBox of the region
+            bbox_coords     : list [min_lon, min_lat, max_lon, max_lat], the region key
+            time_start/end  : str, "YYYY-MM-DD" (inclusive)
+            refresh_days    : the newest indexed days are searched again, as scenes can
+                              appear in the catalog a little after their acquisition
+
+        Returns:
+            int, number of scenes added or refreshed
+        """
+        # Coverage never extends past today, so future days are searched once they exist
+        today = dt.datetime.now(dt.timezone.utc).date().isoformat()
+        time_start, time_end = time_start[:10], time_end[:10]
+        covered = self.coverage(data_collection, bbox_coords)
+
+        if covered is None:
+            ranges = [(time_start, time_end)]
+            new_start, new_end = time_start, time_end
+        else:
+            ranges = []
+            if time_start < covered[0]:
+                ranges.append((time_start, covered[0]))
+            if time_end > covered[1]:
+                ranges.append((_shift_date(covered[1], -refresh_days), time_end))
+            new_start, new_end = min(time_start, covered[0]), max(time_end, covered[1])
+
+        added = 0
+        for start, end in ranges:
+            self.catalog_queries += 1
+            features = catalog.search(collection=data_collection, bbox=bbox, time=(start, end))
+            added += self.add_scenes(data_collection, bbox_coords, features)
+        if ranges and new_start <= today:  # a window entirely in the future covers nothing yet
+            self._mark_covered(data_collection, bbox_coords, new_start, min(new_end, today))
+        return added
+
+    def scenes(self, data_collection, bbox_coords, time_start, time_end, max_cloud=100):
+        """
+        Indexed scenes of a region as dicts, oldest first.
+        """
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute(
+                """
+                SELECT scene_id, date, datetime, cloud_cover, platform, properties FROM scenes
+                WHERE collection = ? AND region = ? AND date BETWEEN ? AND ?
+                  AND (cloud_cover IS NULL OR cloud_cover <= ?)
+                ORDER BY datetime
+                """,
+                (_collection_key(data_collection), region_key(bbox_coords),
+                 time_start[:10], time_end[:10], max_cloud)
+            ).fetchall()
+        return [{**dict(r), "properties": json.loads(r["properties"])} for r in rows]
+
+    def select_dates(self, data_collection, bbox_coords, time_start, time_end, max_cloud=20, n_images=None):
+        """
+        Distinct acquisition dates with a scene under max_cloud, oldest first (the
+        equivalent of a catalog search with a cloud filter and distinct="date").
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                """
+                SELECT DISTINCT date FROM scenes
+                WHERE collection = ? AND region = ? AND date BETWEEN ? AND ? AND cloud_cover <= ?
+                ORDER BY date
+                """,
+                (_collection_key(data_collection), region_key(bbox_coords),
+                 time_start[:10], time_end[:10], max_cloud)
+            ).fetchall()
+        dates = [r[0] for r in rows]
+        return dates[:n_images] if n_images is not None else dates
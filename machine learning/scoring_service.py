@@ -0,0 +1,307 @@
+import argparse
+import json
+import queue
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import torch
+
+from fusion_inference import SatelliteEmbeddingCache, get_satellite_embedding, model_version
+from hybrid_fusion_pipeline import pad_health_sequences
+from preprocess_health_data import preprocess_health_data_batched
+
+
+REGIONS = {
+    "budapest": [19.00, 47.35, 19.10, 47.45],
+    "helsinki": [24.54, 60.13, 25.15, 60.35],
+}
+DATE_WINDOW = ("2024-08-01", "2024-10-01")
+
+
+class DynamicBatcher:
+    """
+    Queues scoring requests and runs them through HybridFusionModel in micro-batches.
+
+    A collector thread drains the queue until max_batch_size requests are waiting or
+    max_wait_ms passed since the first one, groups them by region and feature count and
+    hands every group to a worker pool; series of different lengths share a batch as packed sequences.
+    Satellite embeddings come from a shared SatelliteEmbeddingCache, so a batch only
+    runs the GRU and the classifier.
+    """
+
+    def __init__(
+        self,
+        model,
+        satellite_provider,
+        max_batch_size=64,
+        max_wait_ms=5.0,
+        workers=2,
+        preprocess=True,
+        cache=None,
+        regions=None
+    ):
+        """
+        Args:
+            model              : HybridFusionModel
+            satellite_provider : callable(region) -> (date_window, [1, C, T, H, W] tensor or
+                                 zero-argument callable returning it)
+            max_batch_size     : int, max requests per forward pass
+            max_wait_ms        : float, max time the first request of a batch waits
+            workers            : int, threads running forward passes
+            preprocess         : bool, apply preprocess_health_data_batched to each batch
+            cache              : SatelliteEmbeddingCache or None
+            regions            : region ids the satellite provider knows (None accepts
+                                 any str region)
+        """
+        self.model = model.eval()
+        self.n_features = model.health_encoder.gru.input_size
+        self.version = model_version(model)
+        self.satellite_provider = satellite_provider
+        self.regions = None if regions is None else frozenset(regions)
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.preprocess = preprocess
+        self.cache = cache or SatelliteEmbeddingCache()
+
+        self._queue = queue.Queue()
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        self._latencies = deque(maxlen=10000)
+        self._completed = 0
+        self._batches = 0
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self._running = True
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+
+    def validate(self, health_ts, region) -> torch.Tensor:
+        """
+        Checks one request; raises ValueError unless the region is a str known to the
+        satellite provider and the health series is [T, F] with T > 0 and F equal to the
+        model's health features.
+        """
+        if not isinstance(region, str):
+            raise ValueError("region must be a string")
+        if self.regions is not None and region not in self.regions:
+            raise ValueError(f"Unknown region: {region}")
+        health_ts = torch.as_tensor(health_ts, dtype=torch.float32)
+        if health_ts.dim() != 2:
+            raise ValueError("health must be a [T, F] list of readings")
+        if health_ts.size(0) == 0:
+            raise ValueError("health must contain at least one reading")
+        if health_ts.size(1) != self.n_features:
+            raise ValueError(f"health has {health_ts.size(1)} features, the model expects {self.n_features}")
+        return health_ts
+
+    def submit(self, health_ts, region) -> Future:
+        """
+        Enqueues one [T, F] health series for a region; the future resolves to the
+        [num_classes] probability tensor (or to ValueError for an invalid request, which
+        never reaches a batch).
+        """
+        future = Future()
+        try:
+            health_ts = self.validate(health_ts, region)
+        except ValueError as e:
+            future.set_exception(e)
+            return future
+        with self._lock:
+            if not self._running:
+                future.set_exception(RuntimeError("DynamicBatcher is closed"))
+                return future
+            self._queue.put((health_ts, region, future, time.perf_counter()))
+        return future
+
+    def score(self, health_ts, region, timeout=None):
+        return self.submit(health_ts, region).result(timeout)
+
+    def _collect(self):
+        while self._running:
+            try:
+                first = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            batch = [first]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            # A request that cannot be grouped or dispatched fails alone, the loop goes on
+            groups = defaultdict(list)
+            for item in batch:
+                try:
+                    groups[item[1], item[0].size(1)].append(item)
+                except Exception as e:
+                    item[2].set_exception(e)
+            for (region, _), items in groups.items():
+                try:
+                    self._pool.submit(self._run, region, items)
+                except Exception as e:
+                    for item in items:
+                        item[2].set_exception(e)
+
+    def _run(self, region, items):
+        futures = [item[2] for item in items]
+        try:
+            date_window, sat_seq = self.satellite_provider(region)
+            s_embed = get_satellite_embedding(self.model, region, date_window, sat_seq, self.cache, self.version)
+            series = [item[0] for item in items]
+            if self.preprocess:
+                series = self._preprocess(series)
+            health, lengths = pad_health_sequences(series)
+            with torch.inference_mode():
+                logits = self.model.forward_with_sat_embedding(health, s_embed, lengths)
+                probs = torch.softmax(logits, dim=1)
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+
+        now = time.perf_counter()
+        for item, p in zip(items, probs):
+            self._latencies.append(now - item[3])
+            item[2].set_result(p)
+        with self._lock:
+            self._completed += len(items)
+            self._batches += 1
+
+    def _preprocess(self, series):
+        # Vectorized preprocessing per distinct length, so padding never enters the statistics
+        by_length = defaultdict(list)
+        for i, s in enumerate(series):
+            by_length[s.shape].append(i)
+        out = list(series)
+        for indices in by_length.values():
+            cleaned = preprocess_health_data_batched(torch.stack([series[i] for i in indices]))
+            for i, c in zip(indices, cleaned):
+                out[i] = c
+        return out
+
+    def stats(self):
+        """
+        Returns throughput and p50/p99 latency (ms) over the last 10k requests.
+        """
+        latencies = np.array(self._latencies) * 1000
+        elapsed = time.perf_counter() - self._started
+        with self._lock:
+            completed, batches = self._completed, self._batches
+        return {
+            "completed": completed,
+            "batches": batches,
+            "mean_batch_size": completed / batches if batches else 0.0,
+            "requests_per_sec": completed / elapsed if elapsed else 0.0,
+            "p50_ms": float(np.percentile(latencies, 50)) if len(latencies) else None,
+            "p99_ms": float(np.percentile(latencies, 99)) if len(latencies) else None,
+            "embedding_cache": self.cache.stats(),
+        }
+
+    def close(self):
+        """
+        Stops the collector, finishes the batches already handed to the pool and fails
+        the requests still queued, so no caller waits forever.
+        """
+        with self._lock:
+            self._running = False
+        self._collector.join()
+        self._pool.shutdown()
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            item[2].set_exception(RuntimeError("DynamicBatcher is closed"))
+
+
+def make_handler(batcher):
+    class ScoringHandler(BaseHTTPRequestHandler):
+        """
+        POST /score {"region": "budapest", "health": [[...F], ...T]} -> {"probabilities": [...]}
+        GET  /stats -> throughput and latency percentiles
+        """
+
+        def _send(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                self._send(200, batcher.stats())
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/score":
+                self._send(404, {"error": "not found"})
+                return
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                health = batcher.validate(torch.tensor(request["health"], dtype=torch.float32), request["region"])
+                probs = batcher.score(health, request["region"], timeout=60)
+            except (KeyError, ValueError, TypeError) as e:
+                self._send(400, {"error": str(e)})
+                return
+            except Exception as e:
+                self._send(500, {"error": str(e)})
+                return
+            self._send(200, {"probabilities": probs.tolist()})
+
+        def log_message(self, format, *args):
+            pass
+
+    return ScoringHandler
+
+
+if __name__ == "__main__":
+    from hybrid_fusion_pipeline import HybridFusionModel
+
+    parser = argparse.ArgumentParser(description="Dynamic-batching HybridFusionModel scoring service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-batch-size", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+
+    HEALTH_FEATURES = 3
+    model = HybridFusionModel(health_input_dim=HEALTH_FEATURES, sat_input_channels=3, embed_dim=16, num_classes=2)
+
+    def satellite_provider(region):
+        def fetch():
+            from hystorical_satellite_fetcher import get_sentinel_image_tensor
+            from preprocess_satellite_data import preprocess_satellite_data
+
+            sat_raw = get_sentinel_image_tensor(REGIONS[region], *DATE_WINDOW, n_images=5, visualize=False)
+            return preprocess_satellite_data(sat_raw, selected_channels=[0, 1, 2], norm_type="zscore")
+
+        if region not in REGIONS:
+            raise KeyError(f"Unknown region: {region}")
+        return DATE_WINDOW, fetch
+
+    batcher = DynamicBatcher(
+        model, satellite_provider,
+        max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms, workers=args.workers,
+        regions=REGIONS
+    )
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(batcher))
+    print(f"Scoring service listening on http://{args.host}:{args.port} (POST /score, GET /stats)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        batcher.close()
@@ -0,0 +1,292 @@
+import numpy as np
+import torch
+
+
+EARTH_RADIUS_KM = 6371.0
+_OFFSET = 2 ** 21  # keeps negative rows/cols positive inside the int64 cell key
+
+
+def _cell_key(rows, cols):
+    return (np.asarray(rows, dtype=np.int64) + _OFFSET) * (2 * _OFFSET) + (np.asarray(cols, dtype=np.int64) + _OFFSET)
+
+
+def _key_to_cell(key):
+    return int(key // (2 * _OFFSET) - _OFFSET), int(key % (2 * _OFFSET) - _OFFSET)
+
+
+def haversine_km(lon1, lat1, lon2, lat2):
+    lon1, lat1, lon2, lat2 = map(np.radians, (lon1, lat1, lon2, lat2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+class GridSpatialIndex:
+    """
+    In-memory grid index of geotagged symptom reports / patients over satellite cells.
+
+    Uses the same global lon/lat grid as risk_map.split_aoi_into_cells, so a report's cell
+    is found with one floor division and cell ids ("r{row}_c{col}") match the risk map.
+    Points are kept in capacity-doubling arrays and in CSR form (sorted by cell key +
+    offsets). Newly inserted points stay in a pending tail that queries scan linearly
+    until merge_threshold of them accumulate (or group_by_cell needs the full grouping).
+    Removals are tombstones, compacted away at the next merge once they exceed
+    compact_threshold of the rows.
+
+    Every inserted point gets a point index (0, 1, 2, ... in insertion order) that never
+    changes, so a feature array kept alongside (see health_by_cell) stays aligned across
+    compactions; queries return these indices.
+    """
+
+    def __init__(self, cell_size_deg=0.1, merge_threshold=100_000, compact_threshold=0.25):
+        self.cell_size_deg = cell_size_deg
+        self.merge_threshold = merge_threshold
+        self.compact_threshold = compact_threshold
+        self.n_indices = 0  # point indices handed out so far (rows of a feature array)
+
+        # Row storage, valid up to _size; _slots maps a row to its point index
+        self._size = 0
+        self._n_dead = 0
+        self._lon = np.empty(0)
+        self._lat = np.empty(0)
+        self._ids = np.empty(0, dtype=np.int64)
+        self._alive = np.empty(0, dtype=bool)
+        self._slots = np.empty(0, dtype=np.int64)
+        self._id_to_row = {}
+
+        self._order = np.empty(0, dtype=np.int64)      # rows sorted by cell key
+        self._cell_keys = np.empty(0, dtype=np.int64)  # distinct keys in sorted order
+        self._offsets = np.zeros(1, dtype=np.int64)    # CSR offsets into _order
+        self._n_indexed = 0
+
+    @property
+    def lon(self):
+        return self._lon[:self._size]
+
+    @property
+    def lat(self):
+        return self._lat[:self._size]
+
+    @property
+    def ids(self):
+        return self._ids[:self._size]
+
+    @property
+    def alive(self):
+        return self._alive[:self._size]
+
+    def __len__(self):
+        return self._size - self._n_dead
+
+    def cell_of(self, lon, lat):
+        """
+        Vectorized point-in-cell lookup, returns (rows, cols) arrays.
+        """
+        eps = 1e-9
+        rows = np.floor(np.asarray(lat) / self.cell_size_deg + eps).astype(np.int64)
+        cols = np.floor(np.asarray(lon) / self.cell_size_deg + eps).astype(np.int64)
+        return rows, cols
+
+    def _reserve(self, n):
+        # Grows the row arrays by doubling, so appends are amortized O(1) per point
+        capacity = len(self._ids)
+        if self._size + n <= capacity:
+            return
+        capacity = max(self._size + n, 2 * capacity, 1024)
+        for name in ("_lon", "_lat", "_ids", "_alive", "_slots"):
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
+
+    def insert(self, ids, lon, lat):
+        """
+        Bulk-inserts points; re-inserting an existing id moves it (the old entry is removed).
+        An id repeated within one call keeps its last occurrence.
+
+        Returns:
+            np.ndarray [len(ids)] of point indices (rows of any feature array kept
+            alongside); repeated ids all get the index of the kept occurrence
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        lon = np.asarray(lon, dtype=np.float64)
+        lat = np.asarray(lat, dtype=np.float64)
+
+        unique, inverse = np.unique(ids, return_inverse=True)
+        if len(unique) < len(ids):
+            last = np.zeros(len(unique), dtype=np.int64)
+            np.maximum.at(last, inverse, np.arange(len(ids)))
+            keep = np.sort(last)
+            position = np.searchsorted(keep, last[inverse])  # input -> kept occurrence
+            ids, lon, lat = ids[keep], lon[keep], lat[keep]
+        else:
+            position = None
+        if self._id_to_row:
+            self.remove([i for i in ids.tolist() if i in self._id_to_row])
+
+        n, start = len(ids), self._size
+        self._reserve(n)
+        slots = np.arange(self.n_indices, self.n_indices + n)
+        self._ids[start:start + n] = ids
+        self._lon[start:start + n] = lon
+        self._lat[start:start + n] = lat
+        self._alive[start:start + n] = True
+        self._slots[start:start + n] = slots
+        self._size += n
+        self.n_indices += n
+        self._id_to_row.update(zip(ids.tolist(), range(start, start + n)))
+
+        if self._size - self._n_indexed >= self.merge_threshold:
+            self._merge()
+        return slots if position is None else slots[position]
+
+    def remove(self, ids):
+        for i in ids:
+            row = self._id_to_row.pop(int(i), None)
+            if row is not None:
+                self._alive[row] = False
+                self._n_dead += 1
+
+    def _compact(self):
+        # Drops tombstoned rows; point indices (_slots) move with their rows
+        live = np.flatnonzero(self.alive)
+        for name in ("_lon", "_lat", "_ids", "_alive", "_slots"):
+            arr = getattr(self, name)
+            arr[:len(live)] = arr[live]
+        self._size = len(live)
+        self._n_dead = 0
+        self._id_to_row = dict(zip(self.ids.tolist(), range(self._size)))
+
+    def _needs_compaction(self):
+        return self._n_dead > self.compact_threshold * self._size
+
+    def _merge(self):
+        # Rebuild the CSR arrays over all rows (O(N log N), amortized over many inserts)
+        if self._needs_compaction():
+            self._compact()
+        rows, cols = self.cell_of(self.lon, self.lat)
+        keys = _cell_key(rows, cols)
+        self._order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[self._order]
+        self._cell_keys, starts = np.unique(sorted_keys, return_index=True)
+        self._offsets = np.append(starts, len(sorted_keys)).astype(np.int64)
+        self._n_indexed = self._size
+
+    def _pending(self):
+        # Rows inserted since the last merge, scanned linearly until the next one
+        return np.arange(self._n_indexed, self._size)
+
+    def query_cell(self, row, col):
+        """
+        Point indices of the live points inside a grid cell.
+        """
+        key = _cell_key(row, col)
+        pos = np.searchsorted(self._cell_keys, key)
+        if pos < len(self._cell_keys) and self._cell_keys[pos] == key:
+            indexed = self._order[self._offsets[pos]:self._offsets[pos + 1]]
+        else:
+            indexed = np.empty(0, dtype=np.int64)
+
+        pending = self._pending()
+        rows, cols = self.cell_of(self.lon[pending], self.lat[pending])
+        indices = np.concatenate([indexed, pending[(rows == row) & (cols == col)]])
+        return self._slots[indices[self._alive[indices]]]
+
+    def query_point(self, lon, lat):
+        """
+        Point indices of the live points sharing the cell of (lon, lat).
+        """
+        row, col = self.cell_of(lon, lat)
+        return self.query_cell(int(row), int(col))
+
+    def query_radius(self, lon, lat, radius_km):
+        """
+        Point indices of the live points within radius_km (great-circle) of (lon, lat).
+        """
+        dlat = np.degrees(radius_km / EARTH_RADIUS_KM)
+        dlon = dlat / max(np.cos(np.radians(lat)), 1e-6)
+        row0, col0 = self.cell_of(lon - dlon, lat - dlat)
+        row1, col1 = self.cell_of(lon + dlon, lat + dlat)
+
+        rows, cols = np.meshgrid(np.arange(row0, row1 + 1), np.arange(col0, col1 + 1), indexing="ij")
+        keys = _cell_key(rows.ravel(), cols.ravel())
+        pos = np.searchsorted(self._cell_keys, keys)
+        found = pos < len(self._cell_keys)
+        found[found] = self._cell_keys[pos[found]] == keys[found]
+        pos = pos[found]
+
+        candidates = [self._order[self._offsets[p]:self._offsets[p + 1]] for p in pos]
+        candidates = np.concatenate(candidates + [self._pending()]).astype(np.int64)
+        candidates = candidates[self._alive[candidates]]
+        dist = haversine_km(lon, lat, self._lon[candidates], self._lat[candidates])
+        return self._slots[candidates[dist <= radius_km]]
+
+    def group_by_cell(self):
+        """
+        Returns dict cell id -> point indices of the live points in that cell.
+        """
+        if self._n_indexed != self._size or self._needs_compaction():
+            self._merge()
+        groups = {}
+        for pos, key in enumerate(self._cell_keys):
+            indices = self._order[self._offsets[pos]:self._offsets[pos + 1]]
+            indices = indices[self._alive[indices]]
+            if len(indices):
+                row, col = _key_to_cell(key)
+                groups[f"r{row}_c{col}"] = self._slots[indices]
+        return groups
+
+    def health_by_cell(self, features):
+        """
+        Builds the per-cell health batches consumed by HybridFusionModel / risk_map.score_aoi.
+
+        Args:
+            features : [N, T, F] tensor (patients' series) or [N, F] tensor (one symptom
+                       report vector each), row i belonging to point index i
+                       (at least n_indices rows)
+
+        Returns:
+            dict cell id -> [N_cell, T, F] tensor
+        """
+        features = torch.as_tensor(features)
+        if features.dim() == 2:
+            features = features.unsqueeze(1)
+        return {cell_id: features[torch.from_numpy(indices)] for cell_id, indices in self.group_by_cell().items()}
+
+
+if __name__ == "__main__":
+    import time
+
+    rng = np.random.default_rng(0)
+    N = 1_000_000
+    lon = rng.uniform(20.0, 31.0, N)  # Finland
+    lat = rng.uniform(60.0, 70.0, N)
+
+    index = GridSpatialIndex(cell_size_deg=0.1)
+    start = time.perf_counter()
+    index.insert(np.arange(N), lon, lat)
+    print(f"Bulk insert + index of {N:,} reports: {time.perf_counter() - start:.2f} s")
+
+    start = time.perf_counter()
+    rows, cols = index.cell_of(rng.uniform(20, 31, N), rng.uniform(60, 70, N))
+    print(f"Point-in-cell for {N:,} points: {(time.perf_counter() - start) * 1e3:.1f} ms")
+
+    queries = 1000
+    start = time.perf_counter()
+    hits = sum(len(index.query_radius(x, y, 5.0)) for x, y in zip(lon[:queries], lat[:queries]))
+    elapsed = time.perf_counter() - start
+    print(f"{queries} radius queries (5 km): {elapsed * 1e3 / queries:.2f} ms/query, {hits / queries:.0f} hits avg")
+
+    start = time.perf_counter()
+    index.insert(np.arange(N, N + 10_000), rng.uniform(20, 31, 10_000), rng.uniform(60, 70, 10_000))
+    index.remove(range(5_000))
+    index.query_cell(600, 245)
+    print(f"Incremental insert of 10,000 + remove of 5,000: {(time.perf_counter() - start) * 1e3:.1f} ms")
+
+    start = time.perf_counter()
+    for i in range(1000):  # single-report moves
+        index.insert([i + 10_000], rng.uniform(20, 31, 1), rng.uniform(60, 70, 1))
+    print(f"1,000 single-report moves: {(time.perf_counter() - start) * 1e3 / 1000:.3f} ms/insert")
+
+    start = time.perf_counter()
+    batches = index.health_by_cell(torch.randn(index.n_indices, 6))
+    print(f"Per-cell health batches for {len(batches)} cells: {(time.perf_counter() - start) * 1e3:.1f} ms")
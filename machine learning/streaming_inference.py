@@ -0,0 +1,64 @@
+import torch
+
+from preprocess_health_data import OnlineHealthPreprocessor
+
+
+class StreamingScorer:
+    """
+    Incremental per-patient scoring for HybridFusionModel.
+
+    Instead of re-running the GRU over a patient's whole [T, F] history, the scorer keeps
+    each patient's GRU hidden state, while an OnlineHealthPreprocessor keeps the running
+    normalization and outlier statistics. A new reading is cleaned and normalized online,
+    advanced through one GRU step and classified, so the cost of an update does not
+    depend on the history length.
+
+    Note: the batch path normalizes with statistics of the full series, the streaming path
+    can only use the readings seen so far, so early scores of a patient differ slightly.
+    """
+
+    def __init__(self, model, preprocessor=None):
+        self.model = model
+        self.preprocessor = preprocessor or OnlineHealthPreprocessor()
+        self.hidden = {}  # patient_id -> [embed_dim] GRU hidden state
+
+    def update(self, patient_ids, readings, s_embed):
+        """
+        Consumes one new reading per patient and returns the updated probabilities.
+
+        Args:
+            patient_ids : list of hashable patient ids (length B, no duplicates)
+            readings    : [B, F] raw health readings (NaN = missing)
+            s_embed     : [B, embed_dim] or [1, embed_dim] satellite embedding,
+                          e.g. from fusion_inference.get_satellite_embedding
+
+        Returns:
+            torch.Tensor [B, num_classes] – class probabilities
+        """
+        normed = self.preprocessor.update(patient_ids, readings)
+
+        embed_dim = self.model.health_encoder.gru.hidden_size
+        h = torch.stack([self.hidden[pid] if pid in self.hidden else torch.zeros(embed_dim)
+                         for pid in patient_ids])
+
+        with torch.inference_mode():
+            h = self.model.health_encoder.step(normed, h)
+            s_embed = s_embed.expand(h.size(0), -1)
+            logits = self.model.classifier(torch.cat([h, s_embed], dim=1))
+            probs = torch.softmax(logits, dim=1)
+
+        for i, pid in enumerate(patient_ids):
+            self.hidden[pid] = h[i].clone()  # own storage, not a view of the batch
+        return probs
+
+    def reset(self, patient_id):
+        self.hidden.pop(patient_id, None)
+        self.preprocessor.reset(patient_id)
+
+    def save(self, path):
+        torch.save({"hidden": self.hidden, "preprocessor": self.preprocessor.state_dict()}, path)
+
+    def load(self, path):
+        state = torch.load(path)
+        self.hidden = state["hidden"]
+        self.preprocessor.load_state_dict(state["preprocessor"])
@@ -1,40 +1,138 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
 import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
-from noise import pnoise1
+
+from patient_store import N_BUCKETS, write_bucket
 
 # Configuration
 num_patients = 5
 num_hours = 7 * 24  # one week
 start_time = datetime(2025, 1, 1, 0, 0)
 
-def generate_perlin_series(base, variation, scale=0.05, seed=0):
-    return np.array([base + variation * pnoise1(i * scale + seed) for i in range(num_hours)])
-
-# Excel writer
-with pd.ExcelWriter("synthetic_patients_data.xlsx", engine="openpyxl") as writer:
-    for patient_id in range(num_patients):
-        timestamps = [start_time + timedelta(hours=i) for i in range(num_hours)]
-        
-        # Use patient_id to offset noise seed for uniqueness
-        body_temp = generate_perlin_series(36.5, 0.4, scale=0.03, seed=patient_id * 10 + 1)
-        pulse = generate_perlin_series(70, 10, scale=0.04, seed=patient_id * 10 + 2)
-        spo2 = generate_perlin_series(98, 1.5, scale=0.02, seed=patient_id * 10 + 3)
-        resp_rate = generate_perlin_series(16, 3, scale=0.05, seed=patient_id * 10 + 4)
-        steps = np.maximum(0, generate_perlin_series(500, 400, scale=0.06, seed=patient_id * 10 + 5)).astype(int)
-        sleep_raw = generate_perlin_series(1.0, 1.0, scale=0.01, seed=patient_id * 10 + 6)
-        sleep_state = np.digitize(sleep_raw, bins=[0.5, 1.5])
-
-        df = pd.DataFrame({
-            "timestamp": timestamps,
-            "body_temperature_C": np.round(body_temp, 2),
-            "pulse_bpm": np.round(pulse).astype(int),
-            "blood_oxygen_percent": np.round(spo2, 1),
-            "respiratory_rate": np.round(resp_rate, 1),
-            "steps_per_hour": steps,
-            "sleep_state": sleep_state
-        })
-
-        df.to_excel(writer, sheet_name=str(patient_id), index=False)
-
-print("Synthetic Excel file generated: synthetic_patients_data.xlsx")
+# Ken Perlin's reference permutation (same table as noise.pnoise1)
+_PERM = np.array([
+    151, 160, 137, 91, 90, 15, 131, 13, 201, 95, 96, 53, 194, 233, 7, 225, 140, 36, 103, 30, 69, 142,
+    8, 99, 37, 240, 21, 10, 23, 190, 6, 148, 247, 120, 234, 75, 0, 26, 197, 62, 94, 252, 219, 203,
+    117, 35, 11, 32, 57, 177, 33, 88, 237, 149, 56, 87, 174, 20, 125, 136, 171, 168, 68, 175, 74,
+    165, 71, 134, 139, 48, 27, 166, 77, 146, 158, 231, 83, 111, 229, 122, 60, 211, 133, 230, 220,
+    105, 92, 41, 55, 46, 245, 40, 244, 102, 143, 54, 65, 25, 63, 161, 1, 216, 80, 73, 209, 76, 132,
+    187, 208, 89, 18, 169, 200, 196, 135, 130, 116, 188, 159, 86, 164, 100, 109, 198, 173, 186, 3,
+    64, 52, 217, 226, 250, 124, 123, 5, 202, 38, 147, 118, 126, 255, 82, 85, 212, 207, 206, 59, 227,
+    47, 16, 58, 17, 182, 189, 28, 42, 223, 183, 170, 213, 119, 248, 152, 2, 44, 154, 163, 70, 221,
+    153, 101, 155, 167, 43, 172, 9, 129, 22, 39, 253, 19, 98, 108, 110, 79, 113, 224, 232, 178, 185,
+    112, 104, 218, 246, 97, 228, 251, 34, 242, 193, 238, 210, 144, 12, 191, 179, 162, 241, 81, 51,
+    145, 235, 249, 14, 239, 107, 49, 192, 214, 31, 181, 199, 106, 157, 184, 84, 204, 176, 115, 121,
+    50, 45, 127, 4, 150, 254, 138, 236, 205, 93, 222, 114, 67, 29, 24, 72, 243, 141, 128, 195, 78,
+    66, 215, 61, 156, 180,
+], dtype=np.int64)
+
+
+def perlin_1d(x: np.ndarray, repeat: int = 1024) -> np.ndarray:
+    """
+    Vectorized 1D Perlin noise, matching noise.pnoise1(x) (one octave) up to float32 precision
+    but evaluated on whole arrays at once.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    cell = np.floor(x)
+    i0 = np.mod(cell, repeat).astype(np.int64)
+    i1 = np.mod(i0 + 1, repeat)
+    f = x - cell
+
+    def grad(hash_, d):
+        g = np.where(hash_ & 8, -1.0, (hash_ & 7) + 1.0)
+        return g * d
+
+    fade = f * f * f * (f * (f * 6 - 15) + 10)
+    g0 = grad(_PERM[i0 & 255], f)
+    g1 = grad(_PERM[i1 & 255], f - 1)
+    return (g0 + fade * (g1 - g0)) * 0.4
+
+
+def generate_patients(patient_ids, hours=num_hours, start=start_time, base_seed=0) -> pd.DataFrame:
+    """
+    Generates hourly readings for a chunk of patients in one vectorized pass.
+
+    Every patient draws its own noise offsets from np.random.default_rng([base_seed, patient_id]),
+    so a patient's series is deterministic regardless of chunking or worker count.
+
+    Returns:
+        pd.DataFrame in long format (patient_id, timestamp, features), sorted by patient and time
+    """
+    patient_ids = np.asarray(patient_ids, dtype=np.int64)
+    offsets = np.stack([np.random.default_rng([base_seed, int(p)]).uniform(0, 1024, size=6)
+                        for p in patient_ids])  # [P, 6]
+    steps = np.arange(hours)[None, :]
+
+    def series(k, base, variation, scale):
+        return base + variation * perlin_1d(steps * scale + offsets[:, k:k + 1])  # [P, hours]
+
+    body_temp = series(0, 36.5, 0.4, 0.03)
+    pulse = series(1, 70, 10, 0.04)
+    spo2 = series(2, 98, 1.5, 0.02)
+    resp_rate = series(3, 16, 3, 0.05)
+    steps_per_hour = np.maximum(0, series(4, 500, 400, 0.06)).astype(int)
+    sleep_state = np.digitize(series(5, 1.0, 1.0, 0.01), bins=[0.5, 1.5])
+
+    timestamps = pd.date_range(start, periods=hours, freq="h")
+    return pd.DataFrame({
+        "patient_id": np.repeat(patient_ids, hours),
+        "timestamp": np.tile(timestamps.to_numpy(), len(patient_ids)),
+        "body_temperature_C": np.round(body_temp, 2).ravel(),
+        "pulse_bpm": np.round(pulse).astype(int).ravel(),
+        "blood_oxygen_percent": np.round(spo2, 1).ravel(),
+        "respiratory_rate": np.round(resp_rate, 1).ravel(),
+        "steps_per_hour": steps_per_hour.ravel(),
+        "sleep_state": sleep_state.ravel(),
+    })
+
+
+def _generate_bucket(args):
+    bucket, patient_ids, hours, start, base_seed, out_root, chunk_size, n_buckets = args
+    write_bucket(
+        (generate_patients(patient_ids[i:i + chunk_size], hours, start, base_seed)
+         for i in range(0, len(patient_ids), chunk_size)),
+        out_root, bucket, n_buckets
+    )
+    return len(patient_ids)
+
+
+def generate_cohort(n_patients, hours, out_root, chunk_size=200, workers=None, base_seed=0, start=start_time,
+                    n_buckets=N_BUCKETS):
+    """
+    Generates a synthetic cohort into the Parquet patient store across a process pool.
+    Each worker owns whole buckets (patient_id % n_buckets) and streams them chunk by
+    chunk into one file per bucket. Returns the throughput in patient-hours per second.
+    """
+    tasks = [
+        (bucket, np.arange(bucket, n_patients, n_buckets), hours, start, base_seed, out_root, chunk_size, n_buckets)
+        for bucket in range(min(n_buckets, n_patients))
+    ]
+    t0 = time.perf_counter()
+    done = 0
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        for n in executor.map(_generate_bucket, tasks):
+            done += n
+            elapsed = time.perf_counter() - t0
+            print(f"{done}/{n_patients} patients, {done * hours / elapsed:,.0f} patient-hours/s", end="\r")
+    elapsed = time.perf_counter() - t0
+    print()
+    return n_patients * hours / elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic patient cohort")
+    parser.add_argument("--patients", type=int, default=num_patients)
+    parser.add_argument("--hours", type=int, default=num_hours)
+    parser.add_argument("--out", default="synthetic_patients_store")
+    parser.add_argument("--chunk-size", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    throughput = generate_cohort(args.patients, args.hours, args.out, args.chunk_size, args.workers, args.seed)
+    print(f"Synthetic patient store generated: {args.out} ({throughput:,.0f} patient-hours/s)")
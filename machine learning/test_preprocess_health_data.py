@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+import torch
+
+from preprocess_health_data import preprocess_health_data, preprocess_health_data_batched
+
+
+def _assert_equivalent(raw):
+    expected = preprocess_health_data(raw)
+    actual = preprocess_health_data_batched(raw)
+    assert actual.shape == expected.shape
+    assert torch.allclose(actual, expected, atol=1e-4, equal_nan=True)
+
+
+@pytest.mark.parametrize("B", [1, 16, 128])
+def test_batched_matches_pandas_random(B):
+    rng = np.random.default_rng(B)
+    raw = rng.normal(size=(B, 168, 6)).astype(np.float32)
+    raw[rng.random(raw.shape) < 0.1] = np.nan
+    raw[rng.random(raw.shape) < 0.01] *= 20
+    _assert_equivalent(torch.from_numpy(raw))
+
+
+def test_batched_matches_pandas_all_nan_series():
+    raw = torch.randn(3, 24, 4)
+    raw[1, :, 2] = float("nan")
+    raw[2] = float("nan")
+    _assert_equivalent(raw)
+
+
+def test_batched_matches_pandas_constant_series():
+    raw = torch.randn(2, 24, 3)
+    raw[0, :, 1] = 37.0
+    raw[1] = 72.0
+    _assert_equivalent(raw)
+
+
+@pytest.mark.parametrize("T", [1, 2])
+def test_batched_matches_pandas_short_series(T):
+    raw = torch.randn(4, T, 3)
+    raw[0, 0, 0] = float("nan")
+    _assert_equivalent(raw)
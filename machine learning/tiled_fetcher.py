@@ -0,0 +1,138 @@
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from sentinelhub import BBox, CRS, SentinelHubRequest, MimeType, bbox_to_dimensions
+
+from hystorical_satellite_fetcher import get_data_with_backoff
+
+
+MAX_TILE_DIM = 2500  # Process API limit in pixels per side
+
+
+def split_bbox_into_tiles(bbox_coords, resolution, max_tile_dim=MAX_TILE_DIM):
+    """
+    Splits a WGS84 bbox into a pixel-aligned grid of sub-tiles at a fixed resolution.
+
+    Args:
+        bbox_coords  : list  [min_lon, min_lat, max_lon, max_lat]
+        resolution   : int   resolution in meters
+        max_tile_dim : int   max width/height of a single tile in pixels
+
+    Returns:
+        (width, height), list of (tile_bbox_coords, (x0, y0, w, h)) where x0/y0 are the
+        pixel offsets of the tile in the full mosaic (y0 counted from the top/north edge)
+    """
+    min_lon, min_lat, max_lon, max_lat = bbox_coords
+    width, height = bbox_to_dimensions(BBox(bbox=bbox_coords, crs=CRS.WGS84), resolution=resolution)
+
+    nx = math.ceil(width / max_tile_dim)
+    ny = math.ceil(height / max_tile_dim)
+    xs = np.linspace(0, width, nx + 1).round().astype(int)
+    ys = np.linspace(0, height, ny + 1).round().astype(int)
+
+    lon_per_px = (max_lon - min_lon) / width
+    lat_per_px = (max_lat - min_lat) / height
+
+    tiles = []
+    for j in range(ny):
+        for i in range(nx):
+            x0, x1 = int(xs[i]), int(xs[i + 1])
+            y0, y1 = int(ys[j]), int(ys[j + 1])
+            tile_bbox = [
+                min_lon + x0 * lon_per_px,
+                max_lat - y1 * lat_per_px,
+                min_lon + x1 * lon_per_px,
+                max_lat - y0 * lat_per_px,
+            ]
+            tiles.append((tile_bbox, (x0, y0, x1 - x0, y1 - y0)))
+    return (width, height), tiles
+
+
+def fetch_tiled_mosaic(
+    bbox_coords,
+    resolution,
+    evalscript,
+    data_collection,
+    time_interval,
+    out_path,
+    n_bands=1,
+    dtype=np.float32,
+    mosaicking_order=None,
+    max_tile_dim=MAX_TILE_DIM,
+    max_workers=4,
+    max_retries=5,
+    config=None,
+    client=None
+):
+    """
+    Downloads a large AOI at native resolution as parallel sub-tiles and stitches them
+    into an on-disk .npy mosaic.
+
+    Each worker writes its tile straight into the memory-mapped mosaic and drops it, so
+    at most max_workers tiles are held in RAM regardless of the AOI size.
+
+    Args:
+        bbox_coords      : list   [min_lon, min_lat, max_lon, max_lat]
+        resolution       : int    resolution in meters (kept for every tile)
+        evalscript       : str    evalscript returning n_bands bands
+        data_collection  : DataCollection
+        time_interval    : tuple  (start, end)
+        out_path         : str    path of the .npy file holding the mosaic
+        n_bands          : int    number of output bands of the evalscript
+        dtype            : numpy dtype of the mosaic
+        mosaicking_order : str or None, e.g. "mostRecent"
+        max_tile_dim     : int    max width/height of a single tile in pixels
+        max_workers      : int    number of tiles downloaded concurrently
+        max_retries      : int    retries per tile when rate limited (HTTP 429)
+        config           : SHConfig or None
+        client           : CDSEClient or None, downloads through its cached token and
+                           pooled session instead of sentinelhub's per-request connections
+
+    Returns:
+        np.memmap of shape [H, W] (n_bands == 1) or [H, W, n_bands]
+    """
+    if client is not None:
+        config = client.config
+    elif config is None:
+        from cdse_config import get_config
+        config = get_config()
+
+    (width, height), tiles = split_bbox_into_tiles(bbox_coords, resolution, max_tile_dim)
+    shape = (height, width) if n_bands == 1 else (height, width, n_bands)
+    mosaic = np.lib.format.open_memmap(out_path, mode="w+", dtype=dtype, shape=shape)
+
+    input_kwargs = {"data_collection": data_collection, "time_interval": time_interval}
+    if mosaicking_order is not None:
+        input_kwargs["mosaicking_order"] = mosaicking_order
+
+    def fetch_tile(tile):
+        tile_bbox, (x0, y0, w, h) = tile
+        request = SentinelHubRequest(
+            evalscript=evalscript,
+            input_data=[SentinelHubRequest.input_data(**input_kwargs)],
+            responses=[SentinelHubRequest.output_response("default", MimeType.TIFF)],
+            bbox=BBox(bbox=tile_bbox, crs=CRS.WGS84),
+            size=(w, h),
+            config=config
+        )
+        if client is not None:
+            data = client.get_data(request)[0]
+        else:
+            data = get_data_with_backoff(request, max_retries=max_retries)[0]
+        mosaic[y0:y0 + h, x0:x0 + w] = data.reshape(mosaic[y0:y0 + h, x0:x0 + w].shape)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for _ in executor.map(fetch_tile, tiles):
+            pass
+
+    mosaic.flush()
+    return mosaic
+
+
+def mosaic_preview(mosaic, max_dim=1000):
+    """
+    Returns a strided (nearest-neighbour) view of the mosaic small enough to plot.
+    """
+    step = max(1, math.ceil(max(mosaic.shape[:2]) / max_dim))
+    return np.asarray(mosaic[::step, ::step])
@@ -0,0 +1,127 @@
+import os
+import queue
+import threading
+
+import numpy as np
+
+
+def _scene_rgb(scene):
+    """
+    [C, H, W] scene -> [H, W, 3] float image in 0-1 (first three bands, per-scene max
+    scaling as in the interactive grid; single-band scenes are shown as grey).
+    """
+    img = np.moveaxis(np.asarray(scene, dtype=np.float32)[:3], 0, -1)
+    if img.shape[-1] < 3:
+        img = np.repeat(img[..., :1], 3, axis=-1)
+    peak = np.nanmax(img) if img.size else 0
+    return np.clip(np.nan_to_num(img / peak if peak > 0 else img), 0, 1)
+
+
+def write_scene_thumbnails(scenes, dates, out_dir, prefix="scene", dpi=100):
+    """
+    Writes one PNG per date of a [C, T, H, W] array with the Agg backend (no display).
+
+    Returns:
+        list of written paths
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for t, date in enumerate(dates):
+        fig = Figure(figsize=(4, 4), dpi=dpi)
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot()
+        ax.imshow(_scene_rgb(scenes[:, t]))
+        ax.set_title(f"Date: {date}")
+        ax.axis("off")
+        path = os.path.join(out_dir, f"{prefix}_{date}.png")
+        fig.savefig(path, bbox_inches="tight")
+        paths.append(path)
+    return paths
+
+
+def write_array_thumbnail(array, path, cmap="gray", title=None, label=None, vmin=None, vmax=None, dpi=100):
+    """
+    Writes a 2-D array (e.g. a mosaic_preview) as a PNG with a colorbar.
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(6, 5), dpi=dpi)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    image = ax.imshow(array, cmap=cmap, vmin=vmin, vmax=vmax)
+    fig.colorbar(image, ax=ax, label=label)
+    if title:
+        ax.set_title(title)
+    ax.axis("off")
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    fig.savefig(path, bbox_inches="tight")
+    return path
+
+
+class ThumbnailWriter:
+    """
+    Renders PNG thumbnails on a background thread so fetches never wait for matplotlib.
+
+    submit_*() take a small strided copy of the data right away (the caller may normalize
+    the tensor in place afterwards) and return immediately; close() waits for the queue.
+    Uses the Agg canvas directly, so it works on headless nodes and never opens a window.
+    """
+
+    def __init__(self, out_dir, max_dim=256, max_pending=64):
+        self.out_dir = out_dir
+        self.max_dim = max_dim
+        self.written = []
+        self.errors = []
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            fn, args, kwargs = job
+            try:
+                result = fn(*args, **kwargs)
+                self.written.extend(result if isinstance(result, list) else [result])
+            except Exception as e:  # a broken thumbnail must never fail the pipeline
+                self.errors.append(e)
+
+    def _thumbnail(self, array):
+        # Strided copy bounded by max_dim along the last two (spatial) axes
+        array = np.asarray(array)
+        step = max(1, -(-max(array.shape[-2:]) // self.max_dim))
+        return np.array(array[..., ::step, ::step], dtype=np.float32)
+
+    def submit_scenes(self, scenes, dates, prefix="scene"):
+        """
+        Queues one thumbnail per date of a [C, T, H, W] (or [1, C, T, H, W]) array/tensor.
+        """
+        scenes = np.asarray(scenes)
+        if scenes.ndim == 5:
+            scenes = scenes[0]
+        self._queue.put((write_scene_thumbnails, (self._thumbnail(scenes), list(dates), self.out_dir, prefix), {}))
+
+    def submit_array(self, array, name, **kwargs):
+        """
+        Queues a single 2-D array thumbnail written to out_dir/name.png.
+        """
+        path = os.path.join(self.out_dir, f"{name}.png")
+        self._queue.put((write_array_thumbnail, (self._thumbnail(array), path), kwargs))
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        return self.written
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()